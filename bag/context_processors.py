@@ -1,7 +1,14 @@
-from decimal import Decimal
-from django.shortcuts import get_object_or_404
+from .pricing import get_bag_contents, get_bag_item_count
 
-from products.models import Product
+LAZY_BAG_KEYS = (
+    "bag_items",
+    "total",
+    "product_count",
+    "delivery",
+    "free_delivery_delta",
+    "free_delivery_threshold",
+    "grand_total",
+)
 
 
 def bag_contents(request):
@@ -12,51 +19,15 @@ def bag_contents(request):
     - Bag items are stored by license type (items_by_license)
     - Pricing depends on license (personal/commercial/extended)
     - Digital products => no delivery charge
-    """
-    bag_items = []
-    total = Decimal("0.00")
-    product_count = 0
-    bag = request.session.get("bag", {})
-
-    for item_id, item_data in bag.items():
-        product = get_object_or_404(Product, pk=item_id)
-
-        # Expected structure:
-        # bag[item_id] = {"items_by_license": {"personal": 1, "commercial": 2}}
-        items_by_license = (item_data or {}).get("items_by_license", {})
-
-        for license_type, quantity in items_by_license.items():
-            quantity = int(quantity)
-
-            unit_price = product.get_price_for_license(license_type)
-            line_total = unit_price * quantity
 
-            total += line_total
-            product_count += quantity
-
-            bag_items.append({
-                "item_id": item_id,
-                "quantity": quantity,
-                "product": product,
-                "license_type": license_type,
-                "unit_price": unit_price,
-                "line_total": line_total,
-            })
-
-    # Digital store: no delivery / shipping
-    delivery = Decimal("0.00")
-    free_delivery_delta = Decimal("0.00")
-    free_delivery_threshold = Decimal("0.00")
-    grand_total = total
-
-    context = {
-        "bag_items": bag_items,
-        "total": total,
-        "product_count": product_count,
-        "delivery": delivery,
-        "free_delivery_delta": free_delivery_delta,
-        "free_delivery_threshold": free_delivery_threshold,
-        "grand_total": grand_total,
-    }
+    Priced values are lazy: the template engine calls them on lookup, so
+    the bag is only queried and priced (once, see bag.pricing) when a
+    template actually reads one of them. The navbar uses bag_item_count,
+    which comes straight from the session.
+    """
+    def lazy(key):
+        return lambda: get_bag_contents(request)[key]
 
+    context = {key: lazy(key) for key in LAZY_BAG_KEYS}
+    context["bag_item_count"] = get_bag_item_count(request)
     return context
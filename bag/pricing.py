@@ -0,0 +1,115 @@
+import json
+from decimal import Decimal
+
+from products.models import Product
+
+
+def _bag_product_ids(bag):
+    """Return the numeric product ids referenced by a session bag."""
+    return [item_id for item_id in bag if str(item_id).isdigit()]
+
+
+def price_bag(bag):
+    """
+    Price a session bag using a single product query.
+
+    Bag structure:
+        bag[item_id] = {"items_by_license": {"personal": 1, "commercial": 2}}
+
+    Products that no longer exist (or malformed item ids) are skipped
+    rather than raising, so a stale session can never break a page render.
+    """
+    bag_items = []
+    total = Decimal("0.00")
+    product_count = 0
+
+    products = Product.objects.select_related("category").in_bulk(
+        _bag_product_ids(bag)
+    )
+
+    for item_id, item_data in bag.items():
+        if not str(item_id).isdigit():
+            continue
+
+        product = products.get(int(item_id))
+        if product is None:
+            continue
+
+        items_by_license = (item_data or {}).get("items_by_license", {})
+
+        for license_type, quantity in items_by_license.items():
+            quantity = int(quantity)
+
+            unit_price = product.get_price_for_license(license_type)
+            line_total = unit_price * quantity
+
+            total += line_total
+            product_count += quantity
+
+            bag_items.append({
+                "item_id": item_id,
+                "quantity": quantity,
+                "product": product,
+                "license_type": license_type,
+                "unit_price": unit_price,
+                "line_total": line_total,
+            })
+
+    # Digital store: no delivery / shipping
+    delivery = Decimal("0.00")
+    free_delivery_delta = Decimal("0.00")
+    free_delivery_threshold = Decimal("0.00")
+    grand_total = total
+
+    return {
+        "bag_items": bag_items,
+        "total": total,
+        "product_count": product_count,
+        "delivery": delivery,
+        "free_delivery_delta": free_delivery_delta,
+        "free_delivery_threshold": free_delivery_threshold,
+        "grand_total": grand_total,
+    }
+
+
+def get_bag_contents(request):
+    """
+    Return the priced bag for this request, computing it at most once.
+
+    The result is memoized on the request and keyed by the bag contents,
+    so the context processor and views (e.g. checkout) share one pricing
+    pass, while a bag modified mid-request is still re-priced.
+    """
+    bag = request.session.get("bag", {})
+    key = json.dumps(bag, sort_keys=True)
+
+    cached = getattr(request, "_bag_contents", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    contents = price_bag(bag)
+    request._bag_contents = (key, contents)
+    return contents
+
+
+def get_bag_item_count(request):
+    """
+    Return the number of items in the bag without touching the database.
+
+    Only the session is read, so this is safe for the navbar badge on
+    every page. The count is memoized on the request alongside the bag key.
+    """
+    bag = request.session.get("bag", {})
+    key = json.dumps(bag, sort_keys=True)
+
+    cached = getattr(request, "_bag_item_count", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    count = 0
+    for item_data in bag.values():
+        items_by_license = (item_data or {}).get("items_by_license", {})
+        count += sum(int(quantity) for quantity in items_by_license.values())
+
+    request._bag_item_count = (key, count)
+    return count
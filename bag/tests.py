@@ -1,3 +1,77 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from products.models import Product
+
+from .context_processors import bag_contents
+from .pricing import get_bag_contents, price_bag
+
+
+class BagPricingTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Kit {i}", sku=f"kit-{i}")
+            for i in range(5)
+        ]
+
+    def _bag(self):
+        return {
+            str(p.id): {"items_by_license": {"personal": 1, "commercial": 2}}
+            for p in self.products
+        }
+
+    def test_prices_whole_bag_in_one_query(self):
+        with self.assertNumQueries(1):
+            contents = price_bag(self._bag())
+
+        self.assertEqual(len(contents["bag_items"]), 10)
+        self.assertEqual(contents["product_count"], 15)
+        self.assertEqual(contents["grand_total"], Decimal("300.00"))
+
+    def test_missing_products_are_skipped(self):
+        bag = self._bag()
+        bag["999999"] = {"items_by_license": {"personal": 1}}
+        bag["not-an-id"] = {"items_by_license": {"personal": 1}}
+
+        contents = price_bag(bag)
+
+        self.assertEqual(len(contents["bag_items"]), 10)
+        self.assertEqual(contents["total"], Decimal("300.00"))
+
+    def test_contents_are_memoized_on_the_request(self):
+        request = RequestFactory().get("/")
+        request.session = {"bag": self._bag()}
+
+        first = get_bag_contents(request)
+        with self.assertNumQueries(0):
+            self.assertIs(get_bag_contents(request), first)
+
+        request.session["bag"] = {}
+        self.assertEqual(get_bag_contents(request)["bag_items"], [])
+
+
+class LazyBagContextTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Kit", sku="kit")
+        self.request = RequestFactory().get("/")
+        self.request.session = {
+            "bag": {str(product.id): {"items_by_license": {"personal": 3}}}
+        }
+
+    def test_item_count_does_not_price_the_bag(self):
+        with self.assertNumQueries(0):
+            context = bag_contents(self.request)
+            self.assertEqual(context["bag_item_count"], 3)
+
+    def test_priced_values_query_once_on_first_read(self):
+        context = bag_contents(self.request)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(context["grand_total"](), Decimal("30.00"))
+            self.assertEqual(len(context["bag_items"]()), 1)
+            self.assertEqual(context["product_count"](), 3)
+
+        self.assertEqual(len(queries), 1)
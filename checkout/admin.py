@@ -1,14 +1,27 @@
 from django.contrib import admin
-from .models import Order, OrderLineItem
+from django.utils import timezone
+
+from design_dock.admin_pagination import EstimatedCountPaginator
+
+from .exports import export_response
+from .models import Entitlement, Order, OrderLineItem, OutboundEmail, WebhookEvent
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
     model = OrderLineItem
     readonly_fields = ("lineitem_total",)
+    # A search box instead of a <select> of every product on every row.
+    autocomplete_fields = ("product",)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
 
 
 class OrderAdmin(admin.ModelAdmin):
     inlines = (OrderLineItemAdminInline,)
+    # An id box instead of a <select> of every user profile.
+    raw_id_fields = ("user_profile",)
 
     readonly_fields = (
         "order_number",
@@ -51,6 +64,77 @@ class OrderAdmin(admin.ModelAdmin):
     )
 
     ordering = ("-date",)
+    date_hierarchy = "date"
+
+    # user_profile renders as its user's username.
+    list_select_related = ("user_profile__user",)
+    # Skip COUNT(*) over the whole table: estimate it, and don't count
+    # it a second time for "N total" on filtered pages.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ("export_csv", "export_jsonl")
+
+    def _export(self, queryset, export_format):
+        filename = f"orders-{timezone.localdate():%Y%m%d}"
+        return export_response(queryset, export_format, filename)
+
+    @admin.action(description="Export selected orders with line items (CSV)")
+    def export_csv(self, request, queryset):
+        return self._export(queryset, "csv")
+
+    @admin.action(description="Export selected orders with line items (JSON Lines)")
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, "jsonl")
+
+
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "event_type", "status", "attempts", "received_at", "processed_at")
+    list_filter = ("status", "event_type")
+    search_fields = ("event_id",)
+    readonly_fields = (
+        "event_id",
+        "event_type",
+        "payload",
+        "attempts",
+        "locked_at",
+        "last_error",
+        "received_at",
+        "processed_at",
+    )
+    ordering = ("-received_at",)
+
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "created_at", "sent_at", "latency_ms")
+    list_filter = ("status",)
+    search_fields = ("subject", "dedupe_key")
+    readonly_fields = (
+        "dedupe_key",
+        "subject",
+        "body",
+        "from_email",
+        "to",
+        "attempts",
+        "locked_at",
+        "last_error",
+        "created_at",
+        "sent_at",
+        "latency_ms",
+    )
+    ordering = ("-created_at",)
+
+
+class EntitlementAdmin(admin.ModelAdmin):
+    list_display = ("user_profile", "product", "license_type", "order", "granted_at")
+    list_filter = ("license_type",)
+    list_select_related = ("user_profile__user", "product", "order")
+    search_fields = ("user_profile__user__username", "user_profile__user__email", "product__sku")
+    raw_id_fields = ("user_profile", "product", "order")
+    readonly_fields = ("granted_at",)
+    ordering = ("-granted_at",)
 
 
 admin.site.register(Order, OrderAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
+admin.site.register(Entitlement, EntitlementAdmin)
@@ -0,0 +1,142 @@
+"""
+Entitlements: the products, and licenses, each user owns.
+
+Rows are written with bulk_create(ignore_conflicts=True) when an order is
+finalized and again when a guest order is attached to a profile, so
+repeating either is harmless. Deleting an order deletes the rows it
+granted; the profile's other orders then grant them again.
+
+With ENTITLEMENT_CACHE_ENABLED (on when the catalog cache is Redis), each
+user's owned-products map is cached in the catalog cache (one query to
+build) and deleted when their entitlements change, once the change has
+committed. Grants also happen in the webhook worker, so the deletion has
+to reach every web process; with a per-process or per-host cache the
+map is read from the database on every call instead.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Entitlement, OrderLineItem
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _owned_key(user_id):
+    return f"entitlements:{user_id}"
+
+
+def invalidate_owned_products(*user_ids):
+    """Drop the cached owned products of ``user_ids`` after commit."""
+    if not settings.ENTITLEMENT_CACHE_ENABLED or not user_ids:
+        return
+    keys = [_owned_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def grant_entitlements(order, lineitems=None):
+    """
+    Record that the order's profile owns each product and license on it.
+    Does nothing for guest orders.
+    """
+    if order.user_profile_id is None:
+        return
+    if lineitems is None:
+        lineitems = order.lineitems.all()
+
+    licenses = {
+        (lineitem.product_id, (lineitem.license_type or "personal").lower())
+        for lineitem in lineitems
+    }
+    Entitlement.objects.bulk_create(
+        [
+            Entitlement(
+                user_profile_id=order.user_profile_id,
+                product_id=product_id,
+                license_type=license_type,
+                order=order,
+            )
+            for product_id, license_type in sorted(licenses)
+        ],
+        ignore_conflicts=True,
+    )
+    invalidate_owned_products(order.user_profile.user_id)
+
+
+def regrant_entitlements(user_profile_id):
+    """
+    Grant again everything the profile's orders still contain, e.g. after
+    one of them (and the entitlements it granted) was deleted.
+    """
+    lineitems = (
+        OrderLineItem.objects.filter(order__user_profile_id=user_profile_id)
+        .order_by("order_id")
+        .values_list("order_id", "product_id", "license_type")
+    )
+    first_order = {}
+    for order_id, product_id, license_type in lineitems:
+        first_order.setdefault((product_id, (license_type or "personal").lower()), order_id)
+
+    Entitlement.objects.bulk_create(
+        [
+            Entitlement(
+                user_profile_id=user_profile_id,
+                product_id=product_id,
+                license_type=license_type,
+                order_id=order_id,
+            )
+            for (product_id, license_type), order_id in sorted(first_order.items())
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _load_owned(user):
+    rows = list(
+        Entitlement.objects.filter(user_profile__user_id=user.pk)
+        .order_by("pk")
+        .values_list("pk", "product_id", "license_type")
+    )
+    products = {}
+    for _, product_id, license_type in rows:
+        products.setdefault(product_id, set()).add(license_type)
+    return {
+        # Changes whenever a row is added or removed.
+        "version": f"{len(rows)}.{rows[-1][0] if rows else 0}",
+        "products": {pk: frozenset(types) for pk, types in products.items()},
+    }
+
+
+def _owned(user):
+    if not settings.ENTITLEMENT_CACHE_ENABLED:
+        return _load_owned(user)
+
+    key = _owned_key(user.pk)
+    owned = _cache().get(key)
+    if owned is None:
+        owned = _load_owned(user)
+        _cache().set(key, owned, settings.ENTITLEMENT_CACHE_TIMEOUT)
+    return owned
+
+
+def owned_products(user):
+    """Return {product_id: frozenset of license types} owned by ``user``."""
+    if not user.is_authenticated:
+        return {}
+    return _owned(user)["products"]
+
+
+def entitlements_version(user):
+    """A token that changes whenever ``user``'s entitlements do."""
+    if not user.is_authenticated:
+        return ""
+    return _owned(user)["version"]
+
+
+def user_owns_product(user, product_id):
+    """True if ``user`` may download ``product_id``."""
+    if not user.is_authenticated:
+        return False
+    return user.is_superuser or product_id in owned_products(user)
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from checkout.webhook_events import claim_due_events, process_event
+
+
+class Command(BaseCommand):
+    help = (
+        "Handle stored Stripe webhook events, retrying failures with "
+        "backoff. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.WEBHOOK_WORKER_POOL_SIZE,
+            help="Events handled concurrently.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Events claimed per round.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait when no events are due.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no events are due instead of polling.",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        try:
+            while True:
+                claimed = claim_due_events(options["batch_size"])
+                if not claimed:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                if pool:
+                    statuses = list(pool.map(self._process, claimed))
+                else:
+                    statuses = [process_event(pk) for pk in claimed]
+
+                summary = ", ".join(
+                    f"{statuses.count(status)} {status}" for status in sorted(set(statuses))
+                )
+                self.stdout.write(f"Handled {len(statuses)} events: {summary}")
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
+        finally:
+            if pool:
+                pool.shutdown(wait=True)
+
+    def _process(self, pk):
+        # Worker threads each hold their own connection; release it so an
+        # idle pool doesn't pin connections open.
+        try:
+            return process_event(pk)
+        finally:
+            connection.close()
@@ -0,0 +1,221 @@
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from checkout.models import Order, OutboundEmail, WebhookEvent
+from checkout.utils import encode_bag_metadata
+from products.models import Product
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for ``payload`` (bytes)."""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def _percentile(latencies, percent):
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the Stripe webhook endpoint with signed synthetic "
+        "payment_intent.succeeded events, including redeliveries and "
+        "out-of-order bursts. Orders are counted in this process's database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=100, help="Distinct PaymentIntents.")
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.25,
+            help="Fraction of events delivered a second time.",
+        )
+        parser.add_argument("--concurrency", type=int, default=10, help="Requests in flight.")
+        parser.add_argument("--bursts", type=int, default=1, help="Waves the deliveries are split into.")
+        parser.add_argument("--burst-pause", type=float, default=1.0, help="Seconds between waves.")
+        parser.add_argument(
+            "--in-order",
+            action="store_true",
+            help="Deliver in creation order instead of shuffled.",
+        )
+        parser.add_argument(
+            "--url",
+            help="Post to a running server (e.g. http://localhost:8000/checkout/wh/) "
+            "instead of in-process. Its STRIPE_WEBHOOK_SECRET must match --secret.",
+        )
+        parser.add_argument(
+            "--secret",
+            default="whsec_loadtest",
+            help="Webhook signing secret (in-process runs use it for the endpoint too).",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the synthetic events, orders and emails afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.values_list("id", flat=True)[:5])
+        if not products:
+            raise CommandError("Need at least one product to build bags from.")
+
+        run_id = uuid.uuid4().hex[:8]
+        events = [self._event(run_id, i, products) for i in range(options["events"])]
+        deliveries = events + random.sample(events, int(len(events) * options["duplicates"]))
+        if not options["in_order"]:
+            random.shuffle(deliveries)
+
+        self.url = options["url"]
+        if self.url:
+            results = self._fire(deliveries, options, self._post_url)
+        else:
+            with override_settings(
+                STRIPE_WEBHOOK_SECRET=options["secret"],
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                results = self._fire(deliveries, options, self._post_local)
+                # The endpoint only queues events; handle them as the worker would.
+                call_command(
+                    "process_webhook_events",
+                    "--once",
+                    "--workers",
+                    str(options["concurrency"]),
+                    stdout=self.stdout,
+                )
+
+        self._report(run_id, events, results)
+
+        if not options["keep"]:
+            pids = [event["data"]["object"]["id"] for event in events]
+            orders = Order.objects.filter(stripe_pid__in=pids)
+            OutboundEmail.objects.filter(
+                dedupe_key__in=[f"order-confirmation:{n}" for n in orders.values_list("order_number", flat=True)]
+            ).delete()
+            orders.delete()
+            WebhookEvent.objects.filter(event_id__startswith=f"evt_load_{run_id}_").delete()
+
+    def _event(self, run_id, i, products):
+        product_id = products[i % len(products)]
+        bag = {str(product_id): {"items_by_license": {"personal": 1 + i % 3}}}
+        return {
+            "id": f"evt_load_{run_id}_{i}",
+            "object": "event",
+            "type": "payment_intent.succeeded",
+            "created": int(time.time()),
+            "data": {
+                "object": {
+                    "id": f"pi_load_{run_id}_{i}",
+                    "object": "payment_intent",
+                    "amount": 1000,
+                    "receipt_email": f"load{i}@example.com",
+                    "metadata": {"username": "anonymous", **encode_bag_metadata(bag)},
+                    "shipping": {"name": f"Load Test {i}", "address": {"country": "GB"}},
+                }
+            },
+        }
+
+    def _fire(self, deliveries, options, post):
+        secret = options["secret"]
+        bursts = max(options["bursts"], 1)
+        size = -(-len(deliveries) // bursts)
+        results = []
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            for n in range(bursts):
+                if n:
+                    time.sleep(options["burst_pause"])
+                wave = deliveries[n * size:(n + 1) * size]
+                results.extend(pool.map(lambda event: post(event, secret), wave))
+        self.elapsed = time.monotonic() - started - options["burst_pause"] * (bursts - 1)
+        return results
+
+    def _timed(self, send, event, secret):
+        payload = json.dumps(event).encode()
+        started = time.monotonic()
+        try:
+            status = send(payload, sign_payload(payload, secret))
+        except Exception as e:
+            status = type(e).__name__
+        return status, (time.monotonic() - started) * 1000
+
+    def _post_local(self, event, secret):
+        client = Client()
+
+        def send(payload, signature):
+            response = client.post(
+                reverse("webhook"),
+                payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature,
+            )
+            return response.status_code
+
+        try:
+            return self._timed(send, event, secret)
+        finally:
+            connection.close()
+
+    def _post_url(self, event, secret):
+        def send(payload, signature):
+            response = requests.post(
+                self.url,
+                data=payload,
+                headers={"Content-Type": "application/json", "Stripe-Signature": signature},
+                timeout=30,
+            )
+            return response.status_code
+
+        return self._timed(send, event, secret)
+
+    def _report(self, run_id, events, results):
+        latencies = sorted(latency for _, latency in results)
+        statuses = Counter(status for status, _ in results)
+
+        pids = [event["data"]["object"]["id"] for event in events]
+        per_pid = Order.objects.filter(stripe_pid__in=pids).values("stripe_pid").annotate(n=Count("id"))
+        orders = sum(row["n"] for row in per_pid)
+        duplicate_orders = sum(row["n"] - 1 for row in per_pid)
+
+        self.stdout.write(f"Run {run_id}: {len(results)} deliveries of {len(events)} events")
+        self.stdout.write("Status codes: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items(), key=str)))
+        self.stdout.write(
+            f"Latency ms: p50={_percentile(latencies, 50):.1f} "
+            f"p95={_percentile(latencies, 95):.1f} p99={_percentile(latencies, 99):.1f} "
+            f"max={latencies[-1] if latencies else 0:.1f}"
+        )
+        self.stdout.write(f"Throughput: {len(results) / max(self.elapsed, 1e-9):,.1f} req/s")
+        summary = (
+            f"Orders: {orders} for {len(events)} intents, "
+            f"{duplicate_orders} duplicate, {len(events) - len(per_pid)} missing"
+        )
+        queued = Counter(
+            WebhookEvent.objects.filter(event_id__startswith=f"evt_load_{run_id}_")
+            .values_list("status", flat=True)
+        )
+        self.stdout.write("Inbox: " + ", ".join(f"{k}={v}" for k, v in sorted(queued.items())))
+        if duplicate_orders:
+            self.stdout.write(self.style.ERROR(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
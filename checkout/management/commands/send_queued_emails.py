@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from checkout.outbox import Throttle, claim_pending_emails, send_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued emails over one reused connection, throttled to "
+        "EMAIL_OUTBOX_RATE_LIMIT. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help="Emails claimed and sent per connection.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.EMAIL_OUTBOX_RATE_LIMIT,
+            help="Maximum messages per second (0 for no limit).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when nothing is queued.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling.",
+        )
+
+    def handle(self, *args, **options):
+        # One throttle for the whole run, so batches don't reset the limit.
+        throttle = Throttle(options["rate"])
+        try:
+            while True:
+                emails = claim_pending_emails(options["batch_size"])
+                if not emails:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                started = time.monotonic()
+                statuses = send_emails(emails, throttle=throttle)
+                elapsed = time.monotonic() - started
+
+                summary = ", ".join(
+                    f"{statuses.count(status)} {status}" for status in sorted(set(statuses))
+                )
+                self.stdout.write(f"Processed {len(statuses)} emails in {elapsed:.1f}s: {summary}")
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.11 on 2026-10-16 20:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_orders(apps, schema_editor):
+    """
+    Before the unique constraint, the checkout view and the webhook could
+    each create an order for one PaymentIntent. Keep the earliest order for
+    every duplicated stripe_pid and delete the copies (and their lines).
+    """
+    Order = apps.get_model("checkout", "Order")
+
+    duplicated = (
+        Order.objects.exclude(stripe_pid="")
+        .values("stripe_pid")
+        .annotate(orders=Count("id"))
+        .filter(orders__gt=1)
+        .values_list("stripe_pid", flat=True)
+    )
+    for stripe_pid in duplicated.iterator():
+        ids = list(
+            Order.objects.filter(stripe_pid=stripe_pid)
+            .order_by("date", "id")
+            .values_list("id", flat=True)
+        )
+        Order.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_remove_orderlineitem_product_size_and_more'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('stripe_pid', ''), _negated=True), fields=('stripe_pid',), name='checkout_order_unique_stripe_pid'),
+        ),
+    ]
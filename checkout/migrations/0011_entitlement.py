@@ -0,0 +1,61 @@
+# Generated by Django 5.2.11 on 2026-10-16 21:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import Coalesce, Lower
+
+
+def backfill_entitlements(apps, schema_editor):
+    """Grant entitlements for every existing order placed by a profile."""
+    Entitlement = apps.get_model("checkout", "Entitlement")
+    OrderLineItem = apps.get_model("checkout", "OrderLineItem")
+
+    rows = (
+        OrderLineItem.objects.filter(order__user_profile__isnull=False)
+        .annotate(license=Lower(Coalesce("license_type", models.Value("personal"))))
+        .values("order__user_profile_id", "product_id", "license")
+        .annotate(first_order=Min("order_id"))
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        batch.append(
+            Entitlement(
+                user_profile_id=row["order__user_profile_id"],
+                product_id=row["product_id"],
+                license_type=row["license"],
+                order_id=row["first_order"],
+            )
+        )
+        if len(batch) >= 1000:
+            Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0010_lookup_indexes'),
+        ('products', '0009_lookup_indexes'),
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('license_type', models.CharField(choices=[('personal', 'Personal'), ('commercial', 'Commercial'), ('extended', 'Extended')], max_length=20)),
+                ('granted_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entitlements', to='checkout.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to='products.product')),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to='profiles.userprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_profile', 'product', 'license_type'), name='checkout_entitlement_unique_license')],
+            },
+        ),
+        migrations.RunPython(backfill_entitlements, migrations.RunPython.noop),
+    ]
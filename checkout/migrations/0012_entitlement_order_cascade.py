@@ -0,0 +1,57 @@
+# Generated by Django 5.2.11 on 2026-10-16 22:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import Coalesce, Lower
+
+
+def revoke_orphaned_entitlements(apps, schema_editor):
+    """
+    Drop entitlements whose order was deleted while the FK was SET_NULL,
+    then re-grant whatever the profiles' remaining orders still contain.
+    """
+    Entitlement = apps.get_model("checkout", "Entitlement")
+    OrderLineItem = apps.get_model("checkout", "OrderLineItem")
+
+    orphaned = Entitlement.objects.filter(order__isnull=True)
+    profile_ids = set(orphaned.values_list("user_profile_id", flat=True))
+    if not profile_ids:
+        return
+    orphaned.delete()
+
+    rows = (
+        OrderLineItem.objects.filter(order__user_profile_id__in=profile_ids)
+        .annotate(license=Lower(Coalesce("license_type", models.Value("personal"))))
+        .values("order__user_profile_id", "product_id", "license")
+        .annotate(first_order=Min("order_id"))
+        .order_by()
+    )
+    Entitlement.objects.bulk_create(
+        [
+            Entitlement(
+                user_profile_id=row["order__user_profile_id"],
+                product_id=row["product_id"],
+                license_type=row["license"],
+                order_id=row["first_order"],
+            )
+            for row in rows
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0011_entitlement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entitlement',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to='checkout.order'),
+        ),
+        migrations.RunPython(revoke_orphaned_entitlements, migrations.RunPython.noop),
+    ]
@@ -2,14 +2,15 @@ import uuid
 from decimal import Decimal
 
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Q, Sum
+from django.utils import timezone
 from django_countries.fields import CountryField
 
 from products.models import Product
 
 
 class Order(models.Model):
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(max_length=32, null=False, editable=False, unique=True)
 
     user_profile = models.ForeignKey(
         "profiles.UserProfile",
@@ -58,16 +59,41 @@ class Order(models.Model):
         default=Decimal("0.00"),
     )
 
+    class Meta:
+        constraints = [
+            # One order per PaymentIntent; the checkout view and the Stripe
+            # webhook both get-or-create on it. Blank pids predate tracking.
+            models.UniqueConstraint(
+                fields=["stripe_pid"],
+                condition=~Q(stripe_pid=""),
+                name="checkout_order_unique_stripe_pid",
+            ),
+        ]
+        indexes = [
+            # Admin and reporting sort all orders by date; order history
+            # lists one profile's orders newest first.
+            models.Index(fields=["date"], name="checkout_order_date_idx"),
+            models.Index(fields=["user_profile", "-date"], name="checkout_order_profile_date"),
+            # The partial unique constraint above can't serve "stripe_pid = %s"
+            # on SQLite, which doesn't infer "<> ''" from an equality match.
+            models.Index(fields=["stripe_pid"], name="checkout_order_stripe_pid_idx"),
+        ]
+
     def _generate_order_number(self):
         """Generate a random, unique order number using UUID."""
         return uuid.uuid4().hex.upper()
 
-    def update_total(self):
-        """Update totals from line items. Digital store => delivery always 0."""
-        self.order_total = (
-            self.lineitems.aggregate(Sum("lineitem_total"))["lineitem_total__sum"]
-            or Decimal("0.00")
-        )
+    def update_total(self, order_total=None):
+        """
+        Update totals from line items. Digital store => delivery always 0.
+        Pass order_total when the caller has already summed the lines.
+        """
+        if order_total is None:
+            order_total = (
+                self.lineitems.aggregate(Sum("lineitem_total"))["lineitem_total__sum"]
+                or Decimal("0.00")
+            )
+        self.order_total = order_total
 
         self.delivery_cost = Decimal("0.00")
         self.grand_total = self.order_total
@@ -121,17 +147,141 @@ class OrderLineItem(models.Model):
         editable=False,
     )
 
-    def save(self, *args, **kwargs):
-        """
-        Set lineitem_total using per-license pricing, then update order totals.
-        """
-        license_type = ( self.license_type or "personal").lower()
+    def calculate_total(self):
+        """Set lineitem_total using per-license pricing."""
+        license_type = (self.license_type or "personal").lower()
         unit_price = self.product.get_price_for_license(license_type)
         self.lineitem_total = unit_price * self.quantity
 
+    def save(self, *args, **kwargs):
+        """
+        Set lineitem_total before saving. Order totals are updated by the
+        post_save/post_delete receivers in checkout/signals.py.
+        """
+        self.calculate_total()
         super().save(*args, **kwargs)
-        self.order.update_total()
 
     def __str__(self):
         license_label = f" ({self.license_type})" if self.license_type else ""
         return f"SKU {self.product.sku}{license_label} on order {self.order.order_number}"
+
+
+class WebhookEvent(models.Model):
+    """
+    A Stripe webhook event, stored on receipt and handled by the
+    process_webhook_events worker. event_id is Stripe's id, so redelivered
+    events are recorded (and handled) once.
+    """
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """
+    A queued email, sent by the send_queued_emails worker. dedupe_key
+    (e.g. one per order confirmation) keeps a message from being queued
+    twice.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    dedupe_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    subject = models.CharField(max_length=998)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Time spent in the backend's send call for the successful attempt.
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class Entitlement(models.Model):
+    """
+    A product license a user owns, written when their order is finalized
+    (see checkout/entitlements.py). One row per profile, product and
+    license type, however many times it was bought.
+    """
+
+    user_profile = models.ForeignKey(
+        "profiles.UserProfile",
+        on_delete=models.CASCADE,
+        related_name="entitlements",
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="entitlements")
+    license_type = models.CharField(max_length=20, choices=OrderLineItem.LICENSE_CHOICES)
+    # The order that first granted it. Deleting that order (fraud, refund)
+    # revokes it; checkout/signals.py re-grants from any other order.
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="entitlements",
+    )
+    granted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_profile", "product", "license_type"],
+                name="checkout_entitlement_unique_license",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_profile} owns {self.product_id} ({self.license_type})"
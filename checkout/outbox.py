@@ -0,0 +1,157 @@
+"""
+Email outbox.
+
+Request and webhook code calls enqueue_email(), which only writes an
+OutboundEmail row. The send_queued_emails worker claims pending rows and
+sends them over a single reused backend connection, one message at a
+time so each gets its own status and latency, throttled to
+EMAIL_OUTBOX_RATE_LIMIT messages per second. Failed messages are retried
+with exponential backoff up to EMAIL_OUTBOX_MAX_ATTEMPTS.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, body, to, dedupe_key=None, from_email=None):
+    """
+    Queue an email for the worker.
+
+    Returns (outbound_email, created); with a dedupe_key, queuing the same
+    message again returns the existing row.
+    """
+    values = {
+        "subject": subject,
+        "body": body,
+        "to": list(to),
+        "from_email": from_email or settings.DEFAULT_FROM_EMAIL,
+    }
+    if dedupe_key is None:
+        return OutboundEmail.objects.create(**values), True
+    return OutboundEmail.objects.get_or_create(dedupe_key=dedupe_key, defaults=values)
+
+
+def claim_pending_emails(limit):
+    """
+    Claim up to ``limit`` due emails, returning them in queue order.
+
+    Emails left "sending" by a worker that died are reclaimed after
+    EMAIL_OUTBOX_CLAIM_TIMEOUT.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    candidates = (
+        OutboundEmail.objects.filter(
+            Q(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            | Q(status=OutboundEmail.SENDING, locked_at__lt=stale)
+        )
+        .order_by("next_attempt_at", "pk")
+        .values_list("pk", "status", "locked_at")[:limit]
+    )
+
+    claimed = [
+        pk
+        for pk, status, locked_at in candidates
+        if OutboundEmail.objects.filter(pk=pk, status=status, locked_at=locked_at).update(
+            status=OutboundEmail.SENDING,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    ]
+    return list(OutboundEmail.objects.filter(pk__in=claimed).order_by("next_attempt_at", "pk"))
+
+
+def _record_failure(email, error):
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        status = OutboundEmail.FAILED
+    else:
+        status = OutboundEmail.PENDING
+    delay = settings.EMAIL_OUTBOX_RETRY_BACKOFF * 2 ** max(email.attempts - 1, 0)
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status=status,
+        locked_at=None,
+        last_error=str(error),
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+    )
+    return status
+
+
+class Throttle:
+    """
+    Spaces sends at least 1 / rate_limit seconds apart. The worker keeps
+    one for its whole run, so the limit also holds across batches.
+    """
+
+    def __init__(self, rate_limit=None):
+        if rate_limit is None:
+            rate_limit = settings.EMAIL_OUTBOX_RATE_LIMIT
+        self.interval = 1 / rate_limit if rate_limit > 0 else 0
+        self.last_sent = None
+
+    def wait(self):
+        if self.last_sent is not None:
+            wait = self.interval - (time.monotonic() - self.last_sent)
+            if wait > 0:
+                time.sleep(wait)
+        self.last_sent = time.monotonic()
+
+
+def send_emails(emails, rate_limit=None, throttle=None):
+    """
+    Send claimed emails over one connection and record each outcome.
+    Pass the same ``throttle`` for every batch to keep to the rate limit
+    between them; otherwise a new one is made from ``rate_limit``.
+
+    Returns a list of the resulting statuses, in order.
+    """
+    if throttle is None:
+        throttle = Throttle(rate_limit)
+
+    connection = get_connection(fail_silently=False)
+    statuses = []
+    try:
+        for email in emails:
+            throttle.wait()
+
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                email.to,
+                connection=connection,
+            )
+            started = time.monotonic()
+            try:
+                # Opens the connection on first use (or after a failure)
+                # and leaves it open for the next message.
+                connection.open()
+                if not connection.send_messages([message]):
+                    raise RuntimeError("The backend did not send the message.")
+            except Exception as e:
+                logger.warning("Email %s failed (attempt %s): %s", email.pk, email.attempts, e)
+                statuses.append(_record_failure(email, e))
+                # The connection may be in a bad state; start afresh.
+                connection.close()
+                continue
+
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                status=OutboundEmail.SENT,
+                locked_at=None,
+                last_error="",
+                sent_at=timezone.now(),
+                latency_ms=round((time.monotonic() - started) * 1000),
+            )
+            statuses.append(OutboundEmail.SENT)
+    finally:
+        connection.close()
+
+    return statuses
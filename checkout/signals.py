@@ -1,7 +1,19 @@
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import Signal, receiver
 
-from .models import OrderLineItem
+from products.models import Product
+from profiles.models import UserProfile
+
+from .entitlements import grant_entitlements, invalidate_owned_products, regrant_entitlements
+from .models import Entitlement, Order, OrderLineItem
+
+# Sent once per order, inside the transaction that creates it, after its
+# line items are written. Orders are only created for confirmed payments
+# (the verified webhook, or a checkout POST whose PaymentIntent Stripe
+# reports as succeeded), so receivers may treat the order as paid.
+# Arguments: order, lineitems.
+order_finalized = Signal()
 
 
 @receiver(post_save, sender=OrderLineItem)
@@ -18,3 +30,53 @@ def update_on_delete(sender, instance, **kwargs):
     Update order total on lineitem delete
     """
     instance.order.update_total()
+
+
+@receiver(order_finalized)
+def grant_on_finalized(sender, order, lineitems, **kwargs):
+    """
+    Give the buyer entitlements to everything on a new order
+    """
+    grant_entitlements(order, lineitems)
+
+
+@receiver(post_delete, sender=Order)
+def regrant_on_order_delete(sender, instance, **kwargs):
+    """
+    The deleted order's entitlements went with it; restore any that the
+    profile's other orders still grant
+    """
+    if instance.user_profile_id is None:
+        return
+    regrant_entitlements(instance.user_profile_id)
+    invalidate_owned_products(instance.user_profile.user_id)
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_on_product_delete(sender, instance, **kwargs):
+    """
+    Refresh every owner's cache with one lookup before the cascade
+    """
+    invalidate_owned_products(
+        *Entitlement.objects.filter(product=instance)
+        .values_list("user_profile__user_id", flat=True)
+        .distinct()
+    )
+
+
+@receiver(pre_delete, sender=UserProfile)
+def invalidate_on_profile_delete(sender, instance, **kwargs):
+    invalidate_owned_products(instance.user_id)
+
+
+@receiver(post_save, sender=Entitlement)
+@receiver(post_delete, sender=Entitlement)
+def invalidate_on_entitlement_change(sender, instance, origin=None, **kwargs):
+    """
+    Entitlements edited one by one (e.g. in the admin) refresh the owner's
+    cache. Cascades from an order, product or profile are handled above.
+    """
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not Entitlement:
+        return
+    invalidate_owned_products(instance.user_profile.user_id)
@@ -0,0 +1,276 @@
+"""
+Shared Stripe API client.
+
+All Stripe API calls go through get_stripe_client(), which wraps a backend
+with:
+
+- a pooled requests.Session and explicit connect/read timeouts
+  (STRIPE_CONNECT_TIMEOUT / STRIPE_READ_TIMEOUT), so connections to Stripe
+  are reused and a slow Stripe cannot hold a worker indefinitely;
+- per-operation latency and error metrics, logged on the
+  "checkout.stripe_client" logger and available from metrics.snapshot();
+- a circuit breaker: after STRIPE_BREAKER_THRESHOLD consecutive outage
+  errors (connection failures, timeouts, 429s, 5xx), calls fail fast with
+  StripeUnavailable for STRIPE_BREAKER_RESET seconds, then a single trial
+  call decides whether to close it again.
+
+STRIPE_CLIENT_BACKEND = "fake" swaps in FakeStripeBackend, which keeps
+PaymentIntents in memory, for tests and offline development.
+"""
+import logging
+import secrets
+import threading
+import time
+from types import SimpleNamespace
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class StripeUnavailable(stripe.error.APIConnectionError):
+    """Raised without calling Stripe while the circuit breaker is open."""
+
+
+def _is_outage(error):
+    """True for errors that say Stripe (or the network) is unhealthy."""
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    return (getattr(error, "http_status", None) or 0) >= 500
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker, safe to share between threads."""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """Return True if a call may go ahead."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_in_flight:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half-open: let one call through to probe Stripe.
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.error("Stripe circuit breaker opened after %s failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+class StripeMetrics:
+    """Call counts, errors and latency per operation."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, elapsed_ms, error=None):
+        with self._lock:
+            stats = self._stats.setdefault(
+                operation,
+                {"calls": 0, "errors": 0, "rejected": 0, "total_ms": 0.0, "max_ms": 0.0},
+            )
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            if isinstance(error, StripeUnavailable):
+                stats["rejected"] += 1
+            elif error is not None:
+                stats["errors"] += 1
+
+        logger.info(
+            "stripe %s %.0fms %s",
+            operation,
+            elapsed_ms,
+            type(error).__name__ if error else "ok",
+        )
+
+    def snapshot(self):
+        """Return a copy of the stats, with mean latency added."""
+        with self._lock:
+            return {
+                operation: {**stats, "mean_ms": stats["total_ms"] / stats["calls"]}
+                for operation, stats in self._stats.items()
+            }
+
+
+class StripeBackend:
+    """The real Stripe API over a pooled, time-limited HTTP session."""
+
+    def __init__(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE)
+        session.mount("https://", adapter)
+
+        http_client = stripe.RequestsClient(
+            timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+            session=session,
+        )
+        self.client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=http_client,
+            max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        )
+
+    def create_payment_intent(self, **params):
+        return self.client.v1.payment_intents.create(params=params)
+
+    def modify_payment_intent(self, intent_id, **params):
+        return self.client.v1.payment_intents.update(intent_id, params=params)
+
+    def retrieve_payment_intent(self, intent_id):
+        return self.client.v1.payment_intents.retrieve(intent_id)
+
+
+class FakeStripeBackend:
+    """In-memory PaymentIntents; no network access."""
+
+    def __init__(self):
+        self.intents = {}
+        self.calls = []
+
+    def create_payment_intent(self, **params):
+        self.calls.append(("create_payment_intent", params))
+        intent_id = f"pi_fake_{secrets.token_hex(8)}"
+        intent = SimpleNamespace(
+            id=intent_id,
+            client_secret=f"{intent_id}_secret_{secrets.token_hex(8)}",
+            status="requires_payment_method",
+            metadata={},
+            **params,
+        )
+        self.intents[intent_id] = intent
+        return intent
+
+    def modify_payment_intent(self, intent_id, **params):
+        self.calls.append(("modify_payment_intent", {"id": intent_id, **params}))
+        intent = self.intents.get(intent_id)
+        if intent is None or intent.status in ("canceled", "succeeded"):
+            raise stripe.error.InvalidRequestError(
+                f"No such payment_intent: '{intent_id}'", "intent", http_status=400
+            )
+        metadata = params.pop("metadata", None)
+        if metadata is not None:
+            intent.metadata.update(metadata)
+        for key, value in params.items():
+            setattr(intent, key, value)
+        return intent
+
+    def retrieve_payment_intent(self, intent_id):
+        self.calls.append(("retrieve_payment_intent", {"id": intent_id}))
+        intent = self.intents.get(intent_id)
+        if intent is None:
+            raise stripe.error.InvalidRequestError(
+                f"No such payment_intent: '{intent_id}'", "intent", http_status=404
+            )
+        return intent
+
+
+BACKENDS = {
+    "stripe": StripeBackend,
+    "fake": FakeStripeBackend,
+}
+
+
+class StripeClient:
+    """Runs backend calls through the circuit breaker and metrics."""
+
+    def __init__(self, backend, breaker, metrics):
+        self.backend = backend
+        self.breaker = breaker
+        self.metrics = metrics
+
+    def _call(self, operation, *args, **kwargs):
+        if not self.breaker.allow():
+            error = StripeUnavailable("Stripe is unavailable (circuit open).")
+            self.metrics.record(operation, 0, error)
+            raise error
+
+        started = time.monotonic()
+        try:
+            result = getattr(self.backend, operation)(*args, **kwargs)
+        except Exception as e:
+            # Anything but a Stripe answer (e.g. a card or validation error)
+            # counts as a failure, so a half-open trial is always resolved.
+            if isinstance(e, stripe.error.StripeError) and not _is_outage(e):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            self.metrics.record(operation, (time.monotonic() - started) * 1000, e)
+            raise
+
+        self.breaker.record_success()
+        self.metrics.record(operation, (time.monotonic() - started) * 1000)
+        return result
+
+    def create_payment_intent(self, **params):
+        return self._call("create_payment_intent", **params)
+
+    def modify_payment_intent(self, intent_id, **params):
+        return self._call("modify_payment_intent", intent_id, **params)
+
+    def retrieve_payment_intent(self, intent_id):
+        return self._call("retrieve_payment_intent", intent_id)
+
+
+_client = None
+_client_lock = threading.Lock()
+metrics = StripeMetrics()
+
+
+def get_stripe_client():
+    """Return the process-wide StripeClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                backend = BACKENDS[settings.STRIPE_CLIENT_BACKEND]()
+                breaker = CircuitBreaker(
+                    settings.STRIPE_BREAKER_THRESHOLD, settings.STRIPE_BREAKER_RESET
+                )
+                _client = StripeClient(backend, breaker, metrics)
+    return _client
+
+
+def reset_stripe_client():
+    """Drop the shared client (and its pool, breaker and fake state)."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    if setting.startswith("STRIPE_"):
+        reset_stripe_client()
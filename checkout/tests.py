@@ -1,3 +1,857 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import stripe
+
+from django.core import mail
+from django.core.cache import caches
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Product
+
+from .entitlements import owned_products, user_owns_product
+from .exports import orders_between
+from .management.commands.replay_webhooks import sign_payload
+from .models import Entitlement, Order, OrderLineItem, OutboundEmail, WebhookEvent
+from .outbox import claim_pending_emails, enqueue_email, send_emails
+from .stripe_client import StripeUnavailable, get_stripe_client, reset_stripe_client
+from .utils import (
+    attach_profile,
+    create_lineitems_from_bag,
+    decode_bag_metadata,
+    encode_bag_metadata,
+    get_or_create_order,
+    queue_confirmation_email,
+)
+from .webhook_events import claim_due_events, process_event, record_event
+from .webhook_handler import StripeWH_Handler
+
+
+def make_order(**kwargs):
+    values = {
+        "full_name": "Test Buyer",
+        "email": "buyer@example.com",
+        "phone_number": "0123456789",
+        "country": "GB",
+        "town_or_city": "London",
+        "street_address1": "1 High Street",
+    }
+    values.update(kwargs)
+    return Order.objects.create(**values)
+
+
+def checkout_form(client_secret, **kwargs):
+    values = {
+        "full_name": "Test Buyer",
+        "email": "buyer@example.com",
+        "phone_number": "0123456789",
+        "country": "GB",
+        "town_or_city": "London",
+        "street_address1": "1 High Street",
+        "client_secret": client_secret,
+    }
+    values.update(kwargs)
+    return values
+
+
+class CreateLineItemsTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f"Kit {i}", sku=f"kit-{i}")
+            for i in range(5)
+        ]
+        self.bag = {
+            str(p.id): {"items_by_license": {"personal": 1, "Commercial": 2}}
+            for p in self.products
+        }
+        self.order = make_order()
+
+    def test_bulk_creates_lines_and_writes_totals_once(self):
+        # product lookup, bulk INSERT, one UPDATE of the order totals
+        # (plus the savepoint pair around them).
+        with self.assertNumQueries(5):
+            create_lineitems_from_bag(self.order, self.bag)
+
+        self.assertEqual(self.order.lineitems.count(), 10)
+        self.assertEqual(
+            set(self.order.lineitems.values_list("license_type", flat=True)),
+            {"personal", "commercial"},
+        )
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_total, Decimal("300.00"))
+        self.assertEqual(self.order.grand_total, Decimal("300.00"))
+
+    def test_missing_product_writes_nothing(self):
+        self.bag["999999"] = {"items_by_license": {"personal": 1}}
+
+        with self.assertRaises(Product.DoesNotExist):
+            create_lineitems_from_bag(self.order, self.bag)
+
+        self.assertFalse(self.order.lineitems.exists())
+
+    def test_single_line_edits_still_update_totals(self):
+        create_lineitems_from_bag(self.order, self.bag)
+
+        lineitem = self.order.lineitems.filter(license_type="personal").first()
+        lineitem.license_type = "extended"
+        lineitem.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.grand_total, Decimal("365.00"))
+
+        lineitem.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.grand_total, Decimal("290.00"))
+
+        OrderLineItem.objects.create(
+            order=self.order, product=self.products[0], quantity=1
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.grand_total, Decimal("300.00"))
+
+
+class OrderIdempotencyTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Kit", sku="kit")
+        self.bag = {str(self.product.id): {"items_by_license": {"personal": 2}}}
+
+    def _event(self, pid="pi_123"):
+        return {
+            "type": "payment_intent.succeeded",
+            "data": {
+                "object": {
+                    "id": pid,
+                    "amount": 2000,
+                    "receipt_email": "buyer@example.com",
+                    "metadata": {"bag": json.dumps(self.bag), "username": "anonymous"},
+                    "shipping": {"name": "Test Buyer", "address": {"country": "GB"}},
+                }
+            },
+        }
+
+    def test_webhook_creates_the_order_once(self):
+        handler = StripeWH_Handler(RequestFactory().post("/"))
+
+        first = handler.handle_payment_intent_succeeded(self._event())
+        second = handler.handle_payment_intent_succeeded(self._event())
+
+        self.assertContains(first, "created order")
+        self.assertContains(second, "existing order")
+        order = Order.objects.get(stripe_pid="pi_123")
+        self.assertEqual(order.lineitems.count(), 1)
+        self.assertEqual(order.grand_total, Decimal("20.00"))
+
+    def test_webhook_reads_compact_bag_metadata(self):
+        event = self._event()
+        event["data"]["object"]["metadata"] = encode_bag_metadata(self.bag)
+
+        StripeWH_Handler(RequestFactory().post("/")).handle_payment_intent_succeeded(event)
+
+        order = Order.objects.get(stripe_pid="pi_123")
+        self.assertEqual(json.loads(order.original_bag), self.bag)
+        self.assertEqual(order.lineitems.get().quantity, 2)
+
+    def test_checkout_reuses_the_webhook_order(self):
+        StripeWH_Handler(RequestFactory().post("/")).handle_payment_intent_succeeded(
+            self._event()
+        )
+
+        order, created = get_or_create_order(
+            "pi_123", defaults={"full_name": "Someone else"}, bag=self.bag
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(order.full_name, "Test Buyer")
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(STRIPE_CLIENT_BACKEND="fake")
+    def test_blank_pid_never_matches_legacy_orders(self):
+        legacy = [make_order(stripe_pid="", email=f"legacy{i}@example.com") for i in range(2)]
+        session = self.client.session
+        session["bag"] = self.bag
+        session.save()
+
+        response = self.client.post(reverse("checkout"), checkout_form("_secret_x"))
+        self.assertRedirects(response, reverse("checkout"), fetch_redirect_response=False)
+        response = self.client.post(reverse("cache_checkout_data"), {"client_secret": "_secret_x"})
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(list(Order.objects.order_by("pk")), legacy)
+        with self.assertRaises(ValueError):
+            get_or_create_order("", defaults={}, bag=self.bag)
+
+    def test_stripe_pid_is_unique_but_blank_is_allowed(self):
+        make_order(stripe_pid="")
+        make_order(stripe_pid="")
+        make_order(stripe_pid="pi_123")
+
+        with self.assertRaises(IntegrityError):
+            make_order(stripe_pid="pi_123")
+
+
+class UniqueStripePidMigrationTests(TransactionTestCase):
+    migrate_from = [
+        ("checkout", "0006_remove_orderlineitem_product_size_and_more"),
+        ("products", "0009_lookup_indexes"),
+    ]
+    migrate_to = [
+        ("checkout", "0007_order_unique_stripe_pid"),
+        ("products", "0009_lookup_indexes"),
+    ]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.migrate_from)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicate_orders_are_removed_before_the_constraint(self):
+        apps = self.executor.loader.project_state(self.migrate_from).apps
+        OldOrder = apps.get_model("checkout", "Order")
+        OldLineItem = apps.get_model("checkout", "OrderLineItem")
+        OldProduct = apps.get_model("products", "Product")
+        product = OldProduct.objects.create(name="Kit", sku="kit")
+        address = {
+            "full_name": "Test Buyer",
+            "email": "buyer@example.com",
+            "phone_number": "0123456789",
+            "country": "GB",
+            "town_or_city": "London",
+            "street_address1": "1 High Street",
+        }
+        orders = [
+            OldOrder.objects.create(order_number=f"ORDER{i}", stripe_pid=pid, **address)
+            for i, pid in enumerate(["pi_1", "pi_1", "pi_1", "pi_2", "", ""])
+        ]
+        for order in orders:
+            OldLineItem.objects.create(
+                order=order, product=product, quantity=1, lineitem_total=Decimal("10.00")
+            )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+
+        apps = executor.loader.project_state(self.migrate_to).apps
+        NewOrder = apps.get_model("checkout", "Order")
+        self.assertEqual(NewOrder.objects.get(stripe_pid="pi_1").id, orders[0].id)
+        self.assertTrue(NewOrder.objects.filter(stripe_pid="pi_2").exists())
+        self.assertEqual(NewOrder.objects.filter(stripe_pid="").count(), 2)
+        self.assertEqual(apps.get_model("checkout", "OrderLineItem").objects.count(), 4)
+
+
+@override_settings(WEBHOOK_MAX_ATTEMPTS=2, WEBHOOK_RETRY_BACKOFF=10)
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Kit", sku="kit")
+        bag = {str(self.product.id): {"items_by_license": {"personal": 1}}}
+        self.event = {
+            "id": "evt_1",
+            "type": "payment_intent.succeeded",
+            "data": {
+                "object": {
+                    "id": "pi_1",
+                    "amount": 1000,
+                    "metadata": {"bag": json.dumps(bag)},
+                    "shipping": {"name": "Test Buyer"},
+                }
+            },
+        }
+
+    def test_redelivered_events_are_stored_once(self):
+        _, created = record_event(self.event)
+        _, duplicate = record_event(self.event)
+
+        self.assertTrue(created)
+        self.assertFalse(duplicate)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_worker_handles_each_event_once(self):
+        record_event(self.event)
+
+        call_command("process_webhook_events", "--once", "--workers", "1", stdout=io.StringIO())
+        call_command("process_webhook_events", "--once", "--workers", "1", stdout=io.StringIO())
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, WebhookEvent.DONE)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(Order.objects.filter(stripe_pid="pi_1").count(), 1)
+
+    def test_claims_are_exclusive(self):
+        record_event(self.event)
+
+        self.assertEqual(len(claim_due_events(10)), 1)
+        self.assertEqual(claim_due_events(10), [])
+
+        # A claim that is never finished is taken over after the timeout.
+        WebhookEvent.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_due_events(10)), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        webhook_event, _ = record_event(self.event)
+
+        with (
+            mock.patch("checkout.webhook_events.dispatch", side_effect=RuntimeError("SMTP down")),
+            self.assertLogs("checkout.webhook_events", "ERROR"),
+        ):
+            [pk] = claim_due_events(10)
+            self.assertEqual(process_event(pk), WebhookEvent.PENDING)
+
+            webhook_event.refresh_from_db()
+            self.assertEqual(webhook_event.last_error, "SMTP down")
+            self.assertGreater(webhook_event.next_attempt_at, timezone.now())
+            self.assertEqual(claim_due_events(10), [])
+
+            WebhookEvent.objects.update(next_attempt_at=timezone.now())
+            [pk] = claim_due_events(10)
+            self.assertEqual(process_event(pk), WebhookEvent.FAILED)
+
+        self.assertEqual(claim_due_events(10), [])
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_BACKOFF=10)
+class EmailOutboxTests(TestCase):
+    def test_confirmation_is_queued_once_without_sending(self):
+        order = make_order()
+
+        queue_confirmation_email(order)
+        order.email_sent = False
+        queue_confirmation_email(order)
+
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, [order.email])
+        self.assertIn(order.order_number, email.subject)
+        self.assertTrue(Order.objects.get(pk=order.pk).email_sent)
+
+    def test_worker_sends_over_one_connection(self):
+        for i in range(3):
+            enqueue_email(f"Subject {i}", "Body", [f"user{i}@example.com"])
+
+        with mock.patch("checkout.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            call_command("send_queued_emails", "--once", "--rate", "0", stdout=io.StringIO())
+
+        get_connection.assert_called_once()
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 0", "Subject 1", "Subject 2"])
+        self.assertFalse(OutboundEmail.objects.exclude(status=OutboundEmail.SENT).exists())
+        self.assertFalse(OutboundEmail.objects.filter(latency_ms__isnull=True).exists())
+
+    def test_rate_limit_holds_across_batches(self):
+        for i in range(3):
+            enqueue_email(f"Subject {i}", "Body", [f"user{i}@example.com"])
+
+        with mock.patch("checkout.outbox.time.sleep") as sleep:
+            call_command(
+                "send_queued_emails", "--once", "--rate", "10", "--batch-size", "1",
+                stdout=io.StringIO(),
+            )
+
+        self.assertEqual(len(mail.outbox), 3)
+        # One wait before each message after the first, batch or not.
+        self.assertEqual(sleep.call_count, 2)
+        for (wait,), _ in sleep.call_args_list:
+            self.assertLessEqual(wait, 0.1)
+
+    @override_settings(EMAIL_OUTBOX_CLAIM_TIMEOUT=60)
+    def test_stuck_sends_are_reclaimed_after_the_claim_timeout(self):
+        stuck, _ = enqueue_email("Stuck", "Body", ["a@example.com"])
+        busy, _ = enqueue_email("Busy", "Body", ["b@example.com"])
+        now = timezone.now()
+        OutboundEmail.objects.filter(pk=stuck.pk).update(
+            status=OutboundEmail.SENDING, locked_at=now - timedelta(seconds=90)
+        )
+        OutboundEmail.objects.filter(pk=busy.pk).update(
+            status=OutboundEmail.SENDING, locked_at=now - timedelta(seconds=30)
+        )
+
+        self.assertEqual(claim_pending_emails(10), [stuck])
+
+    def test_failed_sends_are_retried_then_given_up(self):
+        enqueue_email("Subject", "Body", ["user@example.com"])
+
+        with (
+            mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("refused")),
+            self.assertLogs("checkout.outbox", "WARNING"),
+        ):
+            self.assertEqual(send_emails(claim_pending_emails(10)), [OutboundEmail.PENDING])
+            self.assertEqual(claim_pending_emails(10), [])
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(send_emails(claim_pending_emails(10)), [OutboundEmail.FAILED])
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.last_error, "refused")
+        self.assertEqual(email.attempts, 2)
+
+
+@override_settings(STRIPE_CLIENT_BACKEND="fake")
+class PaymentIntentReuseTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Kit", sku="kit")
+        reset_stripe_client()
+        self.stripe = get_stripe_client().backend
+
+    def _set_bag(self, quantity):
+        session = self.client.session
+        session["bag"] = {str(self.product.id): {"items_by_license": {"personal": quantity}}}
+        session.save()
+
+    def _client_secret(self):
+        response = self.client.get(reverse("checkout"))
+        self.assertEqual(response.status_code, 200)
+        return response.context["client_secret"]
+
+    def _calls(self):
+        return [name for name, _ in self.stripe.calls]
+
+    def test_reloads_reuse_the_intent_without_changing_it(self):
+        self._set_bag(1)
+
+        client_secret = self._client_secret()
+        self.assertEqual(self._client_secret(), client_secret)
+
+        # The reload is answered from the session: no Stripe calls at all.
+        self.assertEqual(self._calls(), ["create_payment_intent"])
+        self.assertEqual(self.stripe.calls[0][1], {"amount": 1000, "currency": "gbp"})
+
+    def test_paid_intent_is_not_handed_out_again(self):
+        # Paid, but the browser never reached checkout_success.
+        self._set_bag(1)
+        client_secret = self._client_secret()
+        [intent] = self.stripe.intents.values()
+        intent.status = "succeeded"
+        make_order(stripe_pid=intent.id)
+
+        self.assertNotEqual(self._client_secret(), client_secret)
+        self.assertEqual(self._calls(), ["create_payment_intent", "create_payment_intent"])
+
+    def test_changed_bag_modifies_the_amount(self):
+        self._set_bag(1)
+        client_secret = self._client_secret()
+
+        self._set_bag(3)
+        self.assertEqual(self._client_secret(), client_secret)
+
+        self.assertEqual(
+            self._calls(),
+            ["create_payment_intent", "modify_payment_intent"],
+        )
+        [intent] = self.stripe.intents.values()
+        self.assertEqual(intent.amount, 3000)
+
+    def test_unmodifiable_intent_is_replaced(self):
+        self._set_bag(1)
+        client_secret = self._client_secret()
+        for intent in self.stripe.intents.values():
+            intent.status = "canceled"
+
+        self._set_bag(2)
+        self.assertNotEqual(self._client_secret(), client_secret)
+        self.assertEqual(len(self.stripe.intents), 2)
+
+
+@override_settings(STRIPE_CLIENT_BACKEND="fake", STRIPE_BREAKER_THRESHOLD=2, STRIPE_BREAKER_RESET=60)
+class StripeClientTests(TestCase):
+    def setUp(self):
+        reset_stripe_client()
+        self.client_ = get_stripe_client()
+        self.outage = stripe.error.APIConnectionError("timed out")
+
+    def test_breaker_fails_fast_after_repeated_outages(self):
+        with (
+            mock.patch.object(self.client_.backend, "create_payment_intent", side_effect=self.outage) as create,
+            self.assertLogs("checkout.stripe_client", "INFO"),
+        ):
+            for _ in range(2):
+                with self.assertRaises(stripe.error.APIConnectionError):
+                    self.client_.create_payment_intent(amount=1000, currency="gbp")
+
+            with self.assertRaises(StripeUnavailable):
+                self.client_.create_payment_intent(amount=1000, currency="gbp")
+
+        self.assertEqual(create.call_count, 2)
+        stats = self.client_.metrics.snapshot()["create_payment_intent"]
+        self.assertGreaterEqual(stats["errors"], 2)
+        self.assertGreaterEqual(stats["rejected"], 1)
+
+    def test_breaker_closes_after_a_successful_trial_call(self):
+        breaker = self.client_.breaker
+        with self.assertLogs("checkout.stripe_client", "ERROR"):
+            breaker.record_failure()
+            breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        breaker.opened_at -= 61
+        with self.assertLogs("checkout.stripe_client", "INFO"):
+            self.client_.create_payment_intent(amount=1000, currency="gbp")
+        self.assertFalse(breaker.is_open)
+
+    def test_unexpected_errors_still_resolve_a_trial_call(self):
+        breaker = self.client_.breaker
+        with self.assertLogs("checkout.stripe_client", "ERROR"):
+            breaker.record_failure()
+            breaker.record_failure()
+        breaker.opened_at -= 61
+
+        with (
+            mock.patch.object(self.client_.backend, "create_payment_intent", side_effect=ValueError("bad json")),
+            self.assertLogs("checkout.stripe_client", "INFO"),
+            self.assertRaises(ValueError),
+        ):
+            self.client_.create_payment_intent(amount=1000, currency="gbp")
+
+        # The failed trial re-opened the breaker; the next probe is allowed later.
+        self.assertTrue(breaker.is_open)
+        breaker.opened_at -= 61
+        self.assertTrue(breaker.allow())
+
+    def test_client_errors_do_not_trip_the_breaker(self):
+        with self.assertLogs("checkout.stripe_client", "INFO"):
+            for _ in range(3):
+                with self.assertRaises(stripe.error.InvalidRequestError):
+                    self.client_.modify_payment_intent("pi_missing", amount=1000)
+
+        self.assertFalse(self.client_.breaker.is_open)
+
+
+@override_settings(STRIPE_CLIENT_BACKEND="fake")
+class CheckoutMetadataTests(TestCase):
+    def setUp(self):
+        reset_stripe_client()
+        self.stripe = get_stripe_client().backend
+        self.intent = self.stripe.create_payment_intent(amount=1000, currency="gbp")
+        self.bag = {
+            str(i): {"items_by_license": {"personal": 1, "extended": 2}}
+            for i in range(1000, 1200)
+        }
+        session = self.client.session
+        session["bag"] = self.bag
+        session.save()
+
+    def _cache(self, save_info=""):
+        return self.client.post(
+            reverse("cache_checkout_data"),
+            {"client_secret": self.intent.client_secret, "save_info": save_info},
+        )
+
+    def test_large_bags_fit_stripe_metadata_limits(self):
+        metadata = encode_bag_metadata(self.bag)
+
+        self.assertLessEqual(len(metadata), 50)
+        self.assertLessEqual(max(len(value) for value in metadata.values()), 500)
+        self.assertEqual(decode_bag_metadata(metadata), self.bag)
+        self.assertEqual(decode_bag_metadata({"bag": json.dumps(self.bag)}), self.bag)
+        self.assertIsNone(decode_bag_metadata({}))
+
+    def test_unchanged_metadata_is_not_pushed_again(self):
+        self.stripe.calls.clear()
+
+        self.assertEqual(self._cache().status_code, 200)
+        self.assertEqual(self._cache().status_code, 200)
+        self.assertEqual(len(self.stripe.calls), 1)
+
+        self._cache(save_info="true")
+        self.assertEqual(len(self.stripe.calls), 2)
+        self.assertEqual(decode_bag_metadata(self.intent.metadata), self.bag)
+
+
+class WebhookReplayTests(TransactionTestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Kit", sku="kit")
+
+    @override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+    def test_locally_signed_events_are_accepted(self):
+        payload = json.dumps({"id": "evt_1", "type": "payment_intent.created"}).encode()
+
+        response = self.client.post(
+            reverse("webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, "whsec_test"),
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            reverse("webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, "whsec_other"),
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_replay_reports_no_duplicate_orders(self):
+        # One request in flight: the in-memory test database can't take
+        # concurrent writers.
+        out = io.StringIO()
+        call_command(
+            "replay_webhooks", "--events", "6", "--duplicates", "0.5",
+            "--concurrency", "1", "--bursts", "2", "--burst-pause", "0", stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn("9 deliveries of 6 events", output)
+        self.assertIn("Status codes: 200=9", output)
+        self.assertIn("Orders: 6 for 6 intents, 0 duplicate, 0 missing", output)
+        # Synthetic data is cleaned up unless --keep is given.
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        products = [Product.objects.create(name=f"Kit {i}", sku=f"kit-{i}") for i in range(2)]
+        bag = {str(p.id): {"items_by_license": {"personal": 1, "extended": 1}} for p in products}
+        for stripe_pid in ("pi_1", "pi_2"):
+            create_lineitems_from_bag(make_order(stripe_pid=stripe_pid), bag)
+        Order.objects.filter(stripe_pid="pi_1").update(date=timezone.now() - timedelta(days=40))
+
+    def test_command_streams_csv_and_jsonl(self):
+        out = io.StringIO()
+        call_command("export_orders", stdout=out, stderr=io.StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["order_number", "date", "full_name"])
+        self.assertEqual(len(lines), 1 + 8)
+
+        out = io.StringIO()
+        start = (timezone.localdate() - timedelta(days=1)).isoformat()
+        call_command("export_orders", "--format", "jsonl", "--start", start, stdout=out, stderr=io.StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row["stripe_pid"] for row in rows}, {"pi_2"})
+        self.assertEqual(rows[0]["country"], "GB")
+        self.assertIn(rows[0]["lineitem_total"], ("10.00", "75.00"))
+
+    def test_date_bounds_are_plain_column_comparisons(self):
+        today = timezone.localdate()
+        orders = orders_between(today, today + timedelta(days=1))
+
+        self.assertEqual(set(orders.values_list("stripe_pid", flat=True)), {"pi_2"})
+        where = str(orders.query).split("WHERE")[1]
+        self.assertNotIn("django_datetime_cast_date", where)
+        self.assertNotIn("::date", where)
+
+    def test_csv_cells_cannot_start_formulas(self):
+        Order.objects.filter(stripe_pid="pi_2").update(full_name="=HYPERLINK(1)", email="@x")
+
+        out = io.StringIO()
+        call_command("export_orders", stdout=out, stderr=io.StringIO())
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+
+        self.assertIn("'=HYPERLINK(1)", {row["full_name"] for row in rows})
+        self.assertIn("'@x", {row["email"] for row in rows})
+        self.assertNotIn("'", "".join(row["lineitem_total"] for row in rows))
+
+    def test_admin_action_streams_a_download(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+
+        response = self.client.post(
+            reverse("admin:checkout_order_changelist"),
+            {
+                "action": "export_csv",
+                "index": 0,
+                "_selected_action": list(Order.objects.values_list("pk", flat=True)),
+            },
+        )
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 1 + 8)
+
+
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        self.product = Product.objects.create(name="Kit", sku="kit")
+        self.bag = {str(self.product.id): {"items_by_license": {"personal": 1, "extended": 1}}}
+
+    def _add_orders(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f"buyer{Order.objects.count()}")
+            order = make_order(user_profile=user.userprofile)
+            create_lineitems_from_bag(order, self.bag)
+
+    def _queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse("admin:checkout_order_changelist")
+        self._add_orders(2)
+        few = self._queries(url)
+        self._add_orders(20)
+        self.assertEqual(self._queries(url), few)
+
+    def test_change_form_uses_autocomplete_for_products(self):
+        self._add_orders(1)
+        order = Order.objects.get()
+        unrelated = Product.objects.create(name="Unrelated", sku="other")
+
+        response = self.client.get(reverse("admin:checkout_order_change", args=[order.pk]))
+
+        self.assertContains(response, "admin-autocomplete")
+        self.assertNotContains(response, f'<option value="{unrelated.pk}">')
+
+    def test_change_form_does_not_list_every_profile(self):
+        self._add_orders(2)
+        order, other = Order.objects.order_by("pk")
+
+        response = self.client.get(reverse("admin:checkout_order_change", args=[order.pk]))
+
+        self.assertContains(response, f'<input type="text" name="user_profile" value="{order.user_profile_id}"')
+        self.assertNotContains(response, f'<option value="{other.user_profile_id}"')
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user("buyer")
+        self.kit = Product.objects.create(name="Kit", sku="kit")
+        self.icons = Product.objects.create(name="Icons", sku="icons")
+
+    def _order(self, pid, bag, **defaults):
+        values = {
+            "full_name": "Test Buyer",
+            "email": "buyer@example.com",
+            "phone_number": "0123456789",
+            "country": "GB",
+            "town_or_city": "London",
+            "street_address1": "1 High Street",
+            **defaults,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return get_or_create_order(pid, values, bag)[0]
+
+    def test_finalized_orders_grant_each_license_once(self):
+        profile = self.user.userprofile
+        bag = {str(self.kit.id): {"items_by_license": {"personal": 2, "commercial": 1}}}
+        self._order("pi_1", bag, user_profile=profile)
+        self._order("pi_2", bag, user_profile=profile)
+
+        self.assertEqual(
+            set(Entitlement.objects.values_list("product_id", "license_type")),
+            {(self.kit.id, "personal"), (self.kit.id, "commercial")},
+        )
+        self.assertEqual(owned_products(self.user), {self.kit.id: {"personal", "commercial"}})
+
+    def test_guest_orders_are_granted_when_attached(self):
+        order = self._order("pi_1", {str(self.icons.id): {"items_by_license": {"extended": 1}}})
+        self.assertFalse(Entitlement.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attach_profile(order, self.user.userprofile)
+
+        self.assertTrue(user_owns_product(self.user, self.icons.id))
+
+    @override_settings(ENTITLEMENT_CACHE_ENABLED=True)
+    def test_owned_products_are_cached_until_a_grant(self):
+        self.assertEqual(owned_products(self.user), {})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(user_owns_product(self.user, self.kit.id))
+        self.assertEqual(len(queries), 0)
+
+        self._order(
+            "pi_1",
+            {str(self.kit.id): {"items_by_license": {"personal": 1}}},
+            user_profile=self.user.userprofile,
+        )
+
+        self.assertTrue(user_owns_product(self.user, self.kit.id))
+
+    def test_without_a_shared_cache_grants_are_seen_at_once(self):
+        self.assertFalse(user_owns_product(self.user, self.kit.id))
+
+        # As if granted by the webhook worker: no invalidation reaches us.
+        Entitlement.objects.bulk_create([
+            Entitlement(user_profile=self.user.userprofile, product=self.kit, license_type="personal")
+        ])
+        self.assertTrue(user_owns_product(self.user, self.kit.id))
+
+    @override_settings(ENTITLEMENT_CACHE_ENABLED=True)
+    def test_deleting_an_order_revokes_what_only_it_granted(self):
+        profile = self.user.userprofile
+        first = self._order(
+            "pi_1",
+            {
+                str(self.kit.id): {"items_by_license": {"personal": 1}},
+                str(self.icons.id): {"items_by_license": {"personal": 1}},
+            },
+            user_profile=profile,
+        )
+        second = self._order(
+            "pi_2", {str(self.kit.id): {"items_by_license": {"personal": 1}}}, user_profile=profile
+        )
+        self.assertEqual(set(owned_products(self.user)), {self.kit.id, self.icons.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+
+        self.assertEqual(owned_products(self.user), {self.kit.id: {"personal"}})
+        self.assertEqual(Entitlement.objects.get().order, second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(owned_products(self.user), {})
+
+    @override_settings(ENTITLEMENT_CACHE_ENABLED=True)
+    def test_deleting_a_product_invalidates_owners_in_bulk(self):
+        bag = {str(self.kit.id): {"items_by_license": {"personal": 1}}}
+        users = [User.objects.create_user(f"owner{i}") for i in range(5)]
+        for i, user in enumerate(users):
+            self._order(f"pi_{i}", bag, user_profile=user.userprofile)
+            self.assertIn(self.kit.id, owned_products(user))
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.kit.delete()
+
+        lookups = [q for q in queries if "profiles_userprofile" in q["sql"] and q["sql"].startswith("SELECT")]
+        self.assertEqual(len(lookups), 1)
+        for user in users:
+            self.assertEqual(owned_products(user), {})
+
+    @override_settings(STRIPE_CLIENT_BACKEND="fake")
+    def test_unpaid_checkout_grants_nothing(self):
+        reset_stripe_client()
+        self.client.force_login(self.user)
+        session = self.client.session
+        session["bag"] = {str(self.kit.id): {"items_by_license": {"personal": 1}}}
+        session.save()
+        client_secret = self.client.get(reverse("checkout")).context["client_secret"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("checkout"), checkout_form(client_secret))
+
+        self.assertRedirects(response, reverse("checkout"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Entitlement.objects.exists())
+        self.assertFalse(user_owns_product(self.user, self.kit.id))
+
+        # Once Stripe reports the payment, the same POST places the order.
+        [intent] = get_stripe_client().backend.intents.values()
+        intent.status = "succeeded"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("checkout"), checkout_form(client_secret))
+
+        order = Order.objects.get()
+        self.assertRedirects(
+            response, reverse("checkout_success", args=[order.order_number]),
+            fetch_redirect_response=False,
+        )
+        self.client.get(response.url)
+        self.assertTrue(user_owns_product(self.user, self.kit.id))
@@ -1,18 +1,167 @@
+import json
+import re
+from decimal import Decimal
+
 from django.conf import settings
-from django.core.mail import send_mail
+from django.db import transaction
 from django.template.loader import render_to_string
 
+from products.models import Product
+
+from .models import Order, OrderLineItem
+from .entitlements import grant_entitlements
+from .outbox import enqueue_email
+from .signals import order_finalized
+
+
+# Stripe allows 50 metadata keys with values of up to 500 characters.
+METADATA_VALUE_LIMIT = 500
+BAG_METADATA_PARTS_KEY = "bag_parts"
+LICENSE_CODES = {"personal": "p", "commercial": "c", "extended": "e"}
+LICENSE_PATTERN = re.compile(r"([a-z])(\d+)")
+
+
+def encode_bag_metadata(bag):
+    """
+    Encode a session bag as compact PaymentIntent metadata.
+
+    {"12": {"items_by_license": {"personal": 1, "extended": 2}}} becomes
+    "12:p1e2", items joined by commas, split into bag_0, bag_1, ... values
+    that fit Stripe's size limit, with the count in bag_parts.
+    """
+    items = []
+    for item_id, item_data in bag.items():
+        items_by_license = (item_data or {}).get("items_by_license", {})
+        licenses = "".join(
+            f"{LICENSE_CODES.get(license_type.lower(), 'p')}{int(quantity)}"
+            for license_type, quantity in items_by_license.items()
+        )
+        if licenses:
+            items.append(f"{item_id}:{licenses}")
+
+    encoded = ",".join(items)
+    parts = [
+        encoded[i:i + METADATA_VALUE_LIMIT]
+        for i in range(0, len(encoded), METADATA_VALUE_LIMIT)
+    ] or [""]
+
+    metadata = {f"bag_{i}": part for i, part in enumerate(parts)}
+    metadata[BAG_METADATA_PARTS_KEY] = str(len(parts))
+    return metadata
+
+
+def decode_bag_metadata(metadata):
+    """
+    Return the bag stored in PaymentIntent metadata, or None.
+
+    Reads both the compact format written by encode_bag_metadata() and
+    the legacy JSON "bag" value. Raises ValueError if the data is corrupt.
+    """
+    if BAG_METADATA_PARTS_KEY not in metadata:
+        if not metadata.get("bag"):
+            return None
+        return json.loads(metadata["bag"])
+
+    licenses = {code: license_type for license_type, code in LICENSE_CODES.items()}
+    encoded = "".join(
+        metadata.get(f"bag_{i}", "") for i in range(int(metadata[BAG_METADATA_PARTS_KEY]))
+    )
+
+    bag = {}
+    for item in filter(None, encoded.split(",")):
+        item_id, codes = item.split(":")
+        items_by_license = {
+            licenses[code]: int(quantity)
+            for code, quantity in LICENSE_PATTERN.findall(codes)
+            if code in licenses
+        }
+        bag[item_id] = {"items_by_license": items_by_license}
+    return bag or None
+
 
-def send_confirmation_email(order):
+def create_lineitems_from_bag(order, bag):
     """
-    Send the user a confirmation email for their order (only once).
+    Add a line item to ``order`` for every product/license in ``bag``.
+
+    All products are loaded with one query and the lines are priced in
+    memory, then inserted with bulk_create and the order totals written
+    once. bulk_create skips OrderLineItem.save() and its signals, which
+    keep totals right for one-off edits (e.g. in the admin).
+
+    Raises Product.DoesNotExist if the bag references a missing product;
+    nothing is written in that case.
+    """
+    product_ids = [item_id for item_id in bag if str(item_id).isdigit()]
+    products = Product.objects.in_bulk(product_ids)
+
+    lineitems = []
+    for item_id, item_data in bag.items():
+        product = products.get(int(item_id)) if str(item_id).isdigit() else None
+        if product is None:
+            raise Product.DoesNotExist(f"Product {item_id} does not exist.")
+
+        items_by_license = (item_data or {}).get("items_by_license", {})
+        for license_type, quantity in items_by_license.items():
+            lineitem = OrderLineItem(
+                order=order,
+                product=product,
+                quantity=int(quantity),
+                license_type=(license_type or "personal").lower(),
+            )
+            lineitem.calculate_total()
+            lineitems.append(lineitem)
+
+    with transaction.atomic():
+        OrderLineItem.objects.bulk_create(lineitems)
+        order.update_total(
+            sum((lineitem.lineitem_total for lineitem in lineitems), Decimal("0.00"))
+        )
+
+    return lineitems
+
+
+def get_or_create_order(stripe_pid, defaults, bag):
+    """
+    Return (order, created) for a PaymentIntent, creating it with its line
+    items if no order has that stripe_pid yet.
+
+    Runs in one transaction with the order row locked, so the checkout view
+    and the Stripe webhook can race safely: the loser of the INSERT gets
+    the winner's complete order back instead of a duplicate. A new order
+    sends order_finalized in the same transaction.
+    """
+    # Blank pids belong to many legacy orders; never look one up by it.
+    if not stripe_pid:
+        raise ValueError("get_or_create_order() needs a stripe_pid.")
+    with transaction.atomic():
+        order, created = Order.objects.select_for_update().get_or_create(
+            stripe_pid=stripe_pid,
+            defaults=defaults,
+        )
+        if created:
+            lineitems = create_lineitems_from_bag(order, bag)
+            order_finalized.send(sender=Order, order=order, lineitems=lineitems)
+    return order, created
+
+
+def attach_profile(order, profile):
+    """
+    Link an order placed without a profile to ``profile`` and give the
+    profile its entitlements.
+    """
+    order.user_profile = profile
+    order.save(update_fields=["user_profile"])
+    grant_entitlements(order)
+
+
+def queue_confirmation_email(order):
+    """
+    Queue the user's order confirmation email (only once).
     """
     # Prevent duplicate emails
     if getattr(order, "email_sent", False):
         return
 
-    cust_email = order.email
-
     subject = render_to_string(
         "checkout/confirmation_emails/confirmation_email_subject.txt",
         {"order": order},
@@ -23,13 +172,13 @@ def send_confirmation_email(order):
         {"order": order, "contact_email": settings.DEFAULT_FROM_EMAIL},
     )
 
-    send_mail(
+    enqueue_email(
         subject,
         body,
-        settings.DEFAULT_FROM_EMAIL,
-        [cust_email],
+        [order.email],
+        dedupe_key=f"order-confirmation:{order.order_number}",
     )
 
-    # Mark as sent
+    # Mark as queued; the outbox worker does the sending.
     order.email_sent = True
     order.save(update_fields=["email_sent"])
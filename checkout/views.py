@@ -1,3 +1,4 @@
+import hashlib
 import json
 from decimal import Decimal
 
@@ -8,13 +9,78 @@ from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.views.decorators.http import require_POST
 
-from bag.context_processors import bag_contents
+from bag.pricing import get_bag_contents
 from products.models import Product
 from profiles.forms import UserProfileForm
 from profiles.models import UserProfile
 
 from .forms import OrderForm
-from .models import Order, OrderLineItem
+from .models import Order
+from .stripe_client import get_stripe_client
+from .utils import attach_profile, encode_bag_metadata, get_or_create_order
+
+
+PAYMENT_INTENT_SESSION_KEY = "payment_intent"
+PAYMENT_METADATA_SESSION_KEY = "payment_intent_metadata"
+
+
+def _get_payment_intent_secret(request, bag, stripe_total):
+    """
+    Return the client_secret of this visitor's PaymentIntent.
+
+    The intent is remembered in the session with a fingerprint of the bag,
+    so reloading the page (or coming back from a form error) reuses it
+    without asking Stripe. An intent that already has an order has been
+    paid, even if the browser never reached checkout_success, so it is
+    never handed out again. If the bag has changed, the amount is modified
+    in place; a new intent is only created when there is none yet or
+    Stripe refuses the change (e.g. the intent succeeded or was cancelled).
+    """
+    fingerprint = hashlib.sha256(
+        json.dumps([bag, stripe_total, settings.STRIPE_CURRENCY], sort_keys=True).encode()
+    ).hexdigest()
+    cached = request.session.get(PAYMENT_INTENT_SESSION_KEY)
+    if cached and Order.objects.filter(stripe_pid=cached["id"]).exists():
+        cached = None
+
+    stripe_client = get_stripe_client()
+    intent = None
+    if cached:
+        if cached["fingerprint"] == fingerprint:
+            return cached["client_secret"]
+        try:
+            stripe_client.modify_payment_intent(cached["id"], amount=stripe_total)
+            intent = cached
+        except stripe.error.StripeError:
+            intent = None
+
+    if intent is None:
+        created = stripe_client.create_payment_intent(
+            amount=stripe_total,
+            currency=settings.STRIPE_CURRENCY,
+        )
+        intent = {"id": created.id, "client_secret": created.client_secret}
+
+    request.session[PAYMENT_INTENT_SESSION_KEY] = {
+        "id": intent["id"],
+        "client_secret": intent["client_secret"],
+        "amount": stripe_total,
+        "fingerprint": fingerprint,
+    }
+    return intent["client_secret"]
+
+
+def _payment_confirmed(pid, stripe_total):
+    """
+    True if Stripe reports the PaymentIntent as paid, for this bag's total.
+    The form is only submitted after confirmCardPayment succeeds, but the
+    POST itself proves nothing, and a new order grants downloads.
+    """
+    try:
+        intent = get_stripe_client().retrieve_payment_intent(pid)
+    except stripe.error.StripeError:
+        return False
+    return intent.status == "succeeded" and intent.amount == stripe_total
 
 
 @require_POST
@@ -29,18 +95,26 @@ def cache_checkout_data(request):
             return HttpResponse(content="Missing client_secret", status=400)
 
         pid = client_secret.split("_secret")[0]
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
-        stripe.PaymentIntent.modify(
-            pid,
-            metadata={
-                "username": (
-                    request.user.username if request.user.is_authenticated else "anonymous"
-                ),
-                "save_info": request.POST.get("save_info", ""),
-                "bag": json.dumps(request.session.get("bag", {})),
-            },
-        )
+        if not pid:
+            return HttpResponse(content="Missing client_secret", status=400)
+
+        metadata = {
+            "username": (
+                request.user.username if request.user.is_authenticated else "anonymous"
+            ),
+            "save_info": request.POST.get("save_info", ""),
+            **encode_bag_metadata(request.session.get("bag", {})),
+        }
+
+        # Retries and double clicks push identical metadata; skip the call.
+        metadata_hash = hashlib.sha256(
+            json.dumps([pid, metadata], sort_keys=True).encode()
+        ).hexdigest()
+        if request.session.get(PAYMENT_METADATA_SESSION_KEY) == metadata_hash:
+            return HttpResponse(status=200)
+
+        get_stripe_client().modify_payment_intent(pid, metadata=metadata)
+        request.session[PAYMENT_METADATA_SESSION_KEY] = metadata_hash
         return HttpResponse(status=200)
 
     except Exception as e:
@@ -63,14 +137,12 @@ def checkout(request):
       - OrderLineItem stores license_type
       - Delivery is 0 (handled in bag totals)
     """
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
     bag = request.session.get("bag", {})
     if not bag:
         messages.error(request, "There's nothing in your bag at the moment")
         return redirect(reverse("products"))
 
-    current_bag = bag_contents(request)
+    current_bag = get_bag_contents(request)
     grand_total = Decimal(str(current_bag["grand_total"]))
     stripe_total = int((grand_total * 100).quantize(Decimal("1")))
 
@@ -97,31 +169,39 @@ def checkout(request):
         order_form = OrderForm(form_data)
 
         if order_form.is_valid():
-            order = order_form.save(commit=False)
-
             # Your JS MUST submit this as a hidden field.
             client_secret = request.POST.get("client_secret", "")
-            if "_secret" not in client_secret:
+            pid = client_secret.split("_secret")[0] if "_secret" in client_secret else ""
+            # A blank pid would match a legacy order placed before tracking.
+            if not pid:
                 messages.error(request, "Payment reference missing. Please try again.")
                 return redirect(reverse("checkout"))
 
-            pid = client_secret.split("_secret")[0]
-            order.stripe_pid = pid
-            order.original_bag = json.dumps(bag)
-            order.save()
-
-            # Create line items from items_by_license
-            for item_id, item_data in bag.items():
-                product = get_object_or_404(Product, pk=item_id)
+            if not _payment_confirmed(pid, stripe_total):
+                messages.error(
+                    request,
+                    "We couldn't confirm your payment. You have not been charged "
+                    "for an order; please try again.",
+                )
+                return redirect(reverse("checkout"))
 
-                items_by_license = (item_data or {}).get("items_by_license", {})
-                for license_type, quantity in items_by_license.items():
-                    OrderLineItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=int(quantity),
-                        license_type=(license_type or "personal").lower(),
-                    )
+            # If the webhook already recorded this payment, reuse its order.
+            try:
+                order, _ = get_or_create_order(
+                    pid,
+                    defaults={
+                        **order_form.cleaned_data,
+                        "original_bag": json.dumps(bag),
+                    },
+                    bag=bag,
+                )
+            except Product.DoesNotExist:
+                messages.error(
+                    request,
+                    "One of the products in your bag is no longer available. "
+                    "Please review your bag and try again.",
+                )
+                return redirect(reverse("view_bag"))
 
             save_info = request.POST.get("save_info")
             request.session["save_info"] = bool(save_info)
@@ -155,10 +235,7 @@ def checkout(request):
         order_form = OrderForm()
 
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-        )
+        client_secret = _get_payment_intent_secret(request, bag, stripe_total)
     except Exception as e:
         print("STRIPE INTENT ERROR:", e)
         messages.error(request, "Sorry, our payment system is unavailable right now.")
@@ -167,7 +244,7 @@ def checkout(request):
     context = {
         "order_form": order_form,
         "stripe_public_key": settings.STRIPE_PUBLIC_KEY,
-        "client_secret": intent.client_secret,
+        "client_secret": client_secret,
     }
     return render(request, "checkout/checkout.html", context)
 
@@ -183,8 +260,7 @@ def checkout_success(request, order_number):
     if request.user.is_authenticated:
         profile = get_object_or_404(UserProfile, user=request.user)
         if not order.user_profile:
-            order.user_profile = profile
-            order.save(update_fields=["user_profile"])
+            attach_profile(order, profile)
 
         if save_info:
             profile_data = {
@@ -202,6 +278,9 @@ def checkout_success(request, order_number):
                 user_profile_form.save()
 
     request.session.pop("bag", None)
+    # The intent is paid; the next checkout needs a new one.
+    request.session.pop(PAYMENT_INTENT_SESSION_KEY, None)
+    request.session.pop(PAYMENT_METADATA_SESSION_KEY, None)
 
     messages.success(
         request,
@@ -0,0 +1,133 @@
+"""
+Durable inbox for Stripe webhook events.
+
+The webhook endpoint only verifies and stores each event (keyed by
+Stripe's event id, so redeliveries are no-ops) and answers 200 straight
+away. The process_webhook_events worker claims due events with a
+conditional UPDATE, so two workers never handle the same event at once,
+runs them through StripeWH_Handler and records the outcome. Failures are
+retried with exponential backoff up to WEBHOOK_MAX_ATTEMPTS; a claim
+that is never finished (a crashed worker) is retried after
+WEBHOOK_CLAIM_TIMEOUT.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import WebhookEvent
+from .webhook_handler import StripeWH_Handler
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookProcessingError(Exception):
+    """A handler reported a failure that should be retried."""
+
+
+def record_event(event):
+    """
+    Store a verified Stripe event for the worker.
+
+    Returns (webhook_event, created); created is False for a redelivery.
+    """
+    return WebhookEvent.objects.get_or_create(
+        event_id=event["id"],
+        defaults={"event_type": event["type"], "payload": event},
+    )
+
+
+def dispatch(event):
+    """Route an event to its StripeWH_Handler method."""
+    handler = StripeWH_Handler(None)
+
+    event_map = {
+        "payment_intent.succeeded": handler.handle_payment_intent_succeeded,
+        "payment_intent.payment_failed": handler.handle_payment_intent_payment_failed,
+        # Add this if you intend to test with: stripe trigger checkout.session.completed
+        "checkout.session.completed": getattr(handler, "handle_checkout_session_completed", handler.handle_event),
+    }
+
+    event_handler = event_map.get(event["type"], handler.handle_event)
+    return event_handler(event)
+
+
+def claim_due_events(limit):
+    """
+    Claim up to ``limit`` events that are due, returning their ids.
+
+    Each claim is a conditional UPDATE on the status/lock the event was
+    read with, so only one worker can win it.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.WEBHOOK_CLAIM_TIMEOUT)
+
+    candidates = (
+        WebhookEvent.objects.filter(
+            Q(status=WebhookEvent.PENDING, next_attempt_at__lte=now)
+            | Q(status=WebhookEvent.PROCESSING, locked_at__lt=stale)
+        )
+        .order_by("next_attempt_at")
+        .values_list("pk", "status", "locked_at")[:limit]
+    )
+
+    claimed = []
+    for pk, status, locked_at in candidates:
+        won = WebhookEvent.objects.filter(
+            pk=pk, status=status, locked_at=locked_at
+        ).update(
+            status=WebhookEvent.PROCESSING,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if won:
+            claimed.append(pk)
+    return claimed
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt, doubling each time."""
+    return settings.WEBHOOK_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+
+
+def process_event(pk):
+    """
+    Handle one claimed event and record the outcome.
+
+    Returns the event's new status.
+    """
+    event = WebhookEvent.objects.get(pk=pk)
+
+    try:
+        response = dispatch(event.payload)
+        if response.status_code >= 500:
+            raise WebhookProcessingError(response.content.decode(errors="replace"))
+    except Exception as e:
+        logger.exception("Webhook event %s failed (attempt %s)", event.event_id, event.attempts)
+        if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            status = WebhookEvent.FAILED
+        else:
+            status = WebhookEvent.PENDING
+        updates = {
+            "status": status,
+            "locked_at": None,
+            "last_error": str(e),
+            "next_attempt_at": timezone.now() + timedelta(seconds=retry_delay(event.attempts)),
+        }
+    else:
+        status = WebhookEvent.DONE
+        updates = {
+            "status": status,
+            "locked_at": None,
+            "last_error": "",
+            "processed_at": timezone.now(),
+        }
+
+    # Only record the outcome if our claim still stands (it may have been
+    # taken over after WEBHOOK_CLAIM_TIMEOUT).
+    WebhookEvent.objects.filter(
+        pk=pk, status=WebhookEvent.PROCESSING, locked_at=event.locked_at
+    ).update(**updates)
+    return status
@@ -1,17 +1,18 @@
 # checkout/webhook_handler.py
 
 import json
-import time
 from decimal import Decimal
 
-from django.conf import settings
-from django.core.mail import send_mail
 from django.http import HttpResponse
-from django.template.loader import render_to_string
 
-from products.models import Product
 from profiles.models import UserProfile
-from .models import Order, OrderLineItem
+from .models import Order
+from .utils import (
+    attach_profile,
+    decode_bag_metadata,
+    get_or_create_order,
+    queue_confirmation_email,
+)
 
 
 class StripeWH_Handler:
@@ -20,31 +21,6 @@ class StripeWH_Handler:
     def __init__(self, request):
         self.request = request
 
-    def _send_confirmation_email(self, order):
-        """Send confirmation email safely (no webhook crash if email fails)."""
-        try:
-            subject = render_to_string(
-                "checkout/confirmation_email_subject.txt",
-                {"order": order},
-            ).strip()
-
-            body = render_to_string(
-                "checkout/confirmation_email_body.txt",
-                {
-                    "order": order,
-                    "contact_email": settings.DEFAULT_FROM_EMAIL,
-                },
-            )
-
-            send_mail(
-                subject,
-                body,
-                settings.DEFAULT_FROM_EMAIL,
-                [order.email],
-            )
-        except Exception:
-            pass
-
     def handle_event(self, event):
         """Handle unknown/unexpected webhook events."""
         return HttpResponse(
@@ -57,23 +33,23 @@ class StripeWH_Handler:
         pid = intent.get("id", "")
 
         metadata = intent.get("metadata") or {}
-        bag_str = metadata.get("bag", "")
         save_info = (metadata.get("save_info") or "").lower()
         username = metadata.get("username", "")
 
-        if not bag_str:
+        try:
+            bag = decode_bag_metadata(metadata)
+        except ValueError:
             return HttpResponse(
-                content="payment_intent.succeeded received (no bag metadata).",
+                content="payment_intent.succeeded received (invalid bag metadata).",
                 status=200,
             )
 
-        try:
-            bag = json.loads(bag_str)
-        except json.JSONDecodeError:
+        if not pid or not bag:
             return HttpResponse(
-                content="payment_intent.succeeded received (invalid bag JSON).",
+                content="payment_intent.succeeded received (no bag metadata).",
                 status=200,
             )
+        bag_str = json.dumps(bag)
 
         # -------------------------
         # Profile (optional)
@@ -122,95 +98,43 @@ class StripeWH_Handler:
             profile.save()
 
         # -------------------------
-        # Attempt to find existing order
-        # -------------------------
-        order = None
-        attempt = 1
-
-        while attempt <= 5:
-            try:
-                order = Order.objects.get(
-                    full_name__iexact=full_name,
-                    email__iexact=email,
-                    grand_total=grand_total,
-                    original_bag=bag_str,
-                    stripe_pid=pid,
-                )
-                break
-            except Order.DoesNotExist:
-                attempt += 1
-                time.sleep(1)
-
-        if order:
-            if profile and not order.user_profile:
-                order.user_profile = profile
-                order.save(update_fields=["user_profile"])
-
-            if hasattr(order, "email_sent"):
-                if not order.email_sent:
-                    self._send_confirmation_email(order)
-                    order.email_sent = True
-                    order.save(update_fields=["email_sent"])
-            else:
-                self._send_confirmation_email(order)
-
-            return HttpResponse(
-                content=f"Webhook verified: existing order {order.order_number}",
-                status=200,
-            )
-
-        # -------------------------
-        # Otherwise create order
+        # Find or create the order for this PaymentIntent
         # -------------------------
         try:
-            order = Order.objects.create(
-                user_profile=profile,
-                full_name=full_name,
-                email=email,
-                phone_number=shipping.get("phone") or "",
-                country=address.get("country") or "",
-                postcode=address.get("postal_code") or "",
-                town_or_city=address.get("city") or "",
-                street_address1=address.get("line1") or "",
-                street_address2=address.get("line2") or "",
-                county=address.get("state") or "",
-                original_bag=bag_str,
-                stripe_pid=pid,
-                grand_total=grand_total,
+            order, created = get_or_create_order(
+                pid,
+                defaults={
+                    "user_profile": profile,
+                    "full_name": full_name,
+                    "email": email,
+                    "phone_number": shipping.get("phone") or "",
+                    "country": address.get("country") or "",
+                    "postcode": address.get("postal_code") or "",
+                    "town_or_city": address.get("city") or "",
+                    "street_address1": address.get("line1") or "",
+                    "street_address2": address.get("line2") or "",
+                    "county": address.get("state") or "",
+                    "original_bag": bag_str,
+                    "grand_total": grand_total,
+                },
+                bag=bag,
             )
-
-            # bag uses items_by_license
-            for item_id, item_data in (bag or {}).items():
-                product = Product.objects.get(id=int(item_id))
-
-                items_by_license = (item_data or {}).get("items_by_license", {})
-                for license_type, quantity in items_by_license.items():
-                    OrderLineItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=int(quantity),
-                        license_type=(license_type or "personal").lower(),
-                    )
-
         except Exception as e:
-            if order:
-                order.delete()
+            # The transaction rolled back the order along with its lines.
             return HttpResponse(
                 content=f"Webhook error creating order: {e}",
                 status=500,
             )
 
-        # Send confirmation once
-        if hasattr(order, "email_sent"):
-            if not order.email_sent:
-                self._send_confirmation_email(order)
-                order.email_sent = True
-                order.save(update_fields=["email_sent"])
-        else:
-            self._send_confirmation_email(order)
+        if not created and profile and not order.user_profile:
+            attach_profile(order, profile)
+
+        # Queue the confirmation once
+        queue_confirmation_email(order)
 
+        status = "created" if created else "existing"
         return HttpResponse(
-            content=f"Webhook verified: created order {order.order_number}",
+            content=f"Webhook verified: {status} order {order.order_number}",
             status=200,
         )
 
@@ -11,3 +11,19 @@ class MediaStorage(S3Boto3Storage):
     location = "media"
     default_acl = None
     file_overwrite = False
+
+
+class PrivateMediaStorage(S3Boto3Storage):
+    """
+    Purchased product files. Never public: the prefix must stay outside the
+    bucket's public-read policy (or AWS_PRIVATE_STORAGE_BUCKET_NAME points
+    at a private bucket), and URLs are always short-lived presigned ones,
+    signed against the bucket rather than the public custom domain.
+    """
+
+    location = "private"
+    default_acl = None
+    file_overwrite = False
+    querystring_auth = True
+    custom_domain = None
+    signature_version = "s3v4"
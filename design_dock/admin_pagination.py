@@ -0,0 +1,40 @@
+"""
+Admin changelist pagination shared by every app.
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts PostgreSQL's table statistics for big, unfiltered
+    querysets instead of running COUNT(*) over the whole table.
+
+    Filtered querysets, small tables and other databases get an exact
+    count. The estimate is only as fresh as the last ANALYZE, which is
+    fine for admin changelists.
+    """
+
+    # Below this many rows a real COUNT(*) is cheap enough.
+    estimate_threshold = 10000
+
+    def _estimate(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql" or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
@@ -5,6 +5,7 @@ Production-ready configuration for Heroku + S3 (Django STORAGES).
 
 from pathlib import Path
 import os
+import sys
 from decimal import Decimal
 
 import dj_database_url
@@ -71,6 +72,7 @@ INSTALLED_APPS = [
     "checkout",
     "home",
     "profiles",
+    "reports",
 ]
 
 SITE_ID = 1
@@ -163,6 +165,80 @@ else:
     }
 
 
+# --------------------------------------------------
+# CACHES
+# --------------------------------------------------
+# The catalog cache can run on:
+#   locmem  - per-process memory (default with DEBUG, i.e. runserver, and
+#             always under `manage.py test`)
+#   file    - shared between workers on ONE host; only for single-host
+#             deploys, set CATALOG_CACHE_BACKEND=file explicitly
+#   redis   - any Redis-compatible server (Redis, Valkey, KeyDB...)
+#             e.g. CATALOG_CACHE_LOCATION=redis://127.0.0.1:6379/1
+#             (requires the "redis" package). Default in production when
+#             REDIS_URL is set.
+#   dummy   - no caching (default in production without REDIS_URL)
+# Invalidation bumps a version stored in this cache, so every process that
+# serves pages OR changes products must share it. The Procfile's worker and
+# images processes save products on their own dynos, where a file cache is
+# a different disk: multi-dyno deploys need Redis to cache the catalog.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+TESTING = sys.argv[1:2] == ["test"]
+CATALOG_CACHE_ALIAS = "catalog"
+CATALOG_CACHE_BACKEND = "locmem" if TESTING else os.environ.get(
+    "CATALOG_CACHE_BACKEND",
+    "locmem" if DEBUG else "redis" if REDIS_URL else "dummy",
+)
+CATALOG_CACHE_TIMEOUT = int(os.environ.get("CATALOG_CACHE_TIMEOUT", "3600"))
+# locmem and file caches cull a third of their entries once they hold this
+# many (Django's default of 300 is less than one page of cards per filter).
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get("CATALOG_CACHE_MAX_ENTRIES", "10000"))
+# Card fragments are keyed by product version, so they can live much longer.
+PRODUCT_CARD_CACHE_TIMEOUT = int(os.environ.get("PRODUCT_CARD_CACHE_TIMEOUT", "604800"))
+
+_CATALOG_CACHE_BACKENDS = {
+    "locmem": (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "design-dock-catalog",
+    ),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        str(BASE_DIR / ".cache" / "catalog"),
+    ),
+    "redis": (
+        "django.core.cache.backends.redis.RedisCache",
+        REDIS_URL or "redis://127.0.0.1:6379/1",
+    ),
+    "dummy": (
+        "django.core.cache.backends.dummy.DummyCache",
+        "",
+    ),
+}
+_catalog_backend, _catalog_location = _CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND]
+_catalog_options = (
+    {"MAX_ENTRIES": CATALOG_CACHE_MAX_ENTRIES}
+    if CATALOG_CACHE_BACKEND in ("locmem", "file")
+    else {}
+)
+
+# Each user's owned products; deleted whenever their entitlements change.
+# Grants happen in the webhook worker too, so this is only safe on a cache
+# every process shares: it stays off unless the catalog cache is Redis.
+ENTITLEMENT_CACHE_ENABLED = CATALOG_CACHE_BACKEND == "redis"
+ENTITLEMENT_CACHE_TIMEOUT = int(os.environ.get("ENTITLEMENT_CACHE_TIMEOUT", "86400"))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    CATALOG_CACHE_ALIAS: {
+        "BACKEND": _catalog_backend,
+        "LOCATION": os.environ.get("CATALOG_CACHE_LOCATION", _catalog_location),
+        "OPTIONS": _catalog_options,
+    },
+}
+
+
 # --------------------------------------------------
 # PASSWORD VALIDATION
 # --------------------------------------------------
@@ -193,11 +269,15 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Purchased product files; outside MEDIA_ROOT so /media/ never serves them.
+PRIVATE_MEDIA_ROOT = BASE_DIR / "private_media"
+
 
 # --------------------------------------------------
 # STORAGES (Local defaults)
 # --------------------------------------------------
-# Local: WhiteNoise + local filesystem uploads
+# Local: WhiteNoise + local filesystem uploads. "private" holds purchased
+# product files (see products/storage.py); its base_url is never routed.
 STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -205,9 +285,32 @@ STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
     },
+    "private": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": PRIVATE_MEDIA_ROOT,
+            "base_url": "/private-media/",
+        },
+    },
 }
 
 
+# Widths (px) of the responsive derivatives built for product images.
+PRODUCT_IMAGE_WIDTHS = (320, 640, 960)
+
+
+# --------------------------------------------------
+# DOWNLOADS
+# --------------------------------------------------
+# Purchased files on S3 are delivered by redirecting to a presigned URL
+# that expires after DOWNLOAD_URL_EXPIRY seconds. For local storage behind
+# nginx, set DOWNLOAD_ACCEL_REDIRECT_PREFIX to an internal location that
+# aliases PRIVATE_MEDIA_ROOT (e.g. "/protected/"); otherwise Django serves
+# the file itself, with Range support. See products/downloads.py.
+DOWNLOAD_URL_EXPIRY = int(os.environ.get("DOWNLOAD_URL_EXPIRY", "300"))
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.environ.get("DOWNLOAD_ACCEL_REDIRECT_PREFIX", "")
+
+
 # --------------------------------------------------
 # AWS / S3 (Production Only)
 # --------------------------------------------------
@@ -235,7 +338,9 @@ if not DEBUG:
     STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/{STATICFILES_LOCATION}/"
     MEDIA_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/{MEDIAFILES_LOCATION}/"
 
-    # Use your custom storages (must NOT set public-read ACLs)
+    # Use your custom storages (must NOT set public-read ACLs). Product
+    # files go under "private/", which the public bucket policy must not
+    # cover; or set AWS_PRIVATE_STORAGE_BUCKET_NAME to a separate bucket.
     STORAGES = {
         "staticfiles": {
             "BACKEND": "custom_storages.StaticStorage",
@@ -243,6 +348,16 @@ if not DEBUG:
         "default": {
             "BACKEND": "custom_storages.MediaStorage",
         },
+        "private": {
+            "BACKEND": "custom_storages.PrivateMediaStorage",
+            "OPTIONS": {
+                "bucket_name": os.environ.get(
+                    "AWS_PRIVATE_STORAGE_BUCKET_NAME", AWS_STORAGE_BUCKET_NAME
+                ),
+                "querystring_expire": DOWNLOAD_URL_EXPIRY,
+                "object_parameters": {"CacheControl": "private, no-store"},
+            },
+        },
     }
 
 
@@ -268,6 +383,18 @@ FREE_DELIVERY_THRESHOLD = Decimal(os.environ.get("FREE_DELIVERY_THRESHOLD", "50"
 STANDARD_DELIVERY_PERCENTAGE = Decimal(os.environ.get("STANDARD_DELIVERY_PERCENTAGE", "10"))
 
 
+# --------------------------------------------------
+# PRODUCT LISTING
+# --------------------------------------------------
+PRODUCTS_PER_PAGE = int(os.environ.get("PRODUCTS_PER_PAGE", "24"))
+
+
+# --------------------------------------------------
+# ORDER HISTORY
+# --------------------------------------------------
+ORDERS_PER_PAGE = int(os.environ.get("ORDERS_PER_PAGE", "10"))
+
+
 # --------------------------------------------------
 # STRIPE
 # --------------------------------------------------
@@ -277,6 +404,23 @@ STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
 STRIPE_WH_SECRET = STRIPE_WEBHOOK_SECRET
 
+# Stripe API calls go through checkout/stripe_client.py. "fake" keeps
+# PaymentIntents in memory for tests and offline development.
+STRIPE_CLIENT_BACKEND = os.getenv("STRIPE_CLIENT_BACKEND", "stripe")
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3.05"))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "10"))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "1"))
+STRIPE_POOL_SIZE = int(os.getenv("STRIPE_POOL_SIZE", "10"))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5"))  # consecutive failures
+STRIPE_BREAKER_RESET = float(os.getenv("STRIPE_BREAKER_RESET", "30"))  # seconds open before a trial call
+
+# Webhook events are stored by the endpoint and handled by the
+# process_webhook_events worker (see checkout/webhook_events.py).
+WEBHOOK_WORKER_POOL_SIZE = int(os.environ.get("WEBHOOK_WORKER_POOL_SIZE", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BACKOFF = int(os.environ.get("WEBHOOK_RETRY_BACKOFF", "30"))  # seconds, doubled per attempt
+WEBHOOK_CLAIM_TIMEOUT = int(os.environ.get("WEBHOOK_CLAIM_TIMEOUT", "300"))  # seconds before a stuck claim is retried
+
 
 # --------------------------------------------------
 # EMAIL
@@ -292,3 +436,11 @@ else:
     EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
     EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
     DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Outgoing mail is queued in checkout.OutboundEmail and sent by the
+# send_queued_emails worker over one reused connection.
+EMAIL_OUTBOX_RATE_LIMIT = float(os.environ.get("EMAIL_OUTBOX_RATE_LIMIT", "1"))  # messages per second
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_RETRY_BACKOFF = int(os.environ.get("EMAIL_OUTBOX_RETRY_BACKOFF", "60"))  # seconds, doubled per attempt
+EMAIL_OUTBOX_CLAIM_TIMEOUT = int(os.environ.get("EMAIL_OUTBOX_CLAIM_TIMEOUT", "600"))  # seconds before a stuck send is retried
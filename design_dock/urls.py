@@ -11,6 +11,7 @@ urlpatterns = [
     path("checkout/", include("checkout.urls")),
     path("accounts/", include("allauth.urls")),
     path("profile/", include("profiles.urls")),
+    path("reports/", include("reports.urls")),
 
 ]
 
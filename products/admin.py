@@ -1,5 +1,10 @@
 from django.contrib import admin
+from django.db.models import Q
+
+from design_dock.admin_pagination import EstimatedCountPaginator
+
 from .models import Product, Category
+from .search import get_search_backend
 
 
 @admin.register(Category)
@@ -20,5 +25,25 @@ class ProductAdmin(admin.ModelAdmin):
         "is_digital",
     )
     list_filter = ("category", "is_digital")
+    list_select_related = ("category",)
     search_fields = ("name", "sku", "description")
     ordering = ("sku",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Search name/description through the full-text index (see
+        products/search.py) instead of icontains scans; an exact sku
+        also matches. Used by the changelist and the order line item
+        autocomplete.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        matches = get_search_backend(queryset.db).search(Product.objects.all(), search_term)
+        return (
+            queryset.filter(Q(pk__in=matches.values("pk")) | Q(sku=search_term)),
+            False,
+        )
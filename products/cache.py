@@ -0,0 +1,137 @@
+"""
+Versioned cache for catalog data (products and categories).
+
+Every entry is stored under the current catalog version, which is bumped
+by the Product/Category post_save and post_delete signals (see
+products/signals.py). Bumping the version makes every older entry
+unreachable at once, so nothing has to be deleted key by key.
+
+The backend is the "catalog" alias in settings.CACHES and can be locmem,
+file based or a Redis-compatible server (CATALOG_CACHE_BACKEND).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import Category, Product
+
+VERSION_KEY = "catalog:version"
+LAST_MODIFIED_KEY = "catalog:last_modified"
+
+_MISSING = object()
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    """Return the current catalog version, initialising it if needed."""
+    cache = catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost version key can never resurrect
+        # entries written under an earlier, smaller version.
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog entry."""
+    cache = catalog_cache()
+    cache.set(LAST_MODIFIED_KEY, timezone.now(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns() // 1000
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def get_catalog_last_modified():
+    """Return when any product or category last changed."""
+    cache = catalog_cache()
+    last_modified = cache.get(LAST_MODIFIED_KEY)
+    if last_modified is None:
+        # Unknown after a cache restart (deletes leave no timestamp behind),
+        # so start from now: clients revalidate once, never see stale pages.
+        cache.add(LAST_MODIFIED_KEY, timezone.now(), timeout=None)
+        last_modified = cache.get(LAST_MODIFIED_KEY)
+    return last_modified
+
+
+def get_or_set(key, producer):
+    """
+    Return the cached value for ``key`` under the current catalog version,
+    calling ``producer()`` to build and store it on a miss. None is a valid
+    cached value (e.g. a product that does not exist).
+    """
+    cache = catalog_cache()
+    version = get_catalog_version()
+
+    value = cache.get(key, _MISSING, version=version)
+    if value is _MISSING:
+        value = producer()
+        cache.set(key, value, settings.CATALOG_CACHE_TIMEOUT, version=version)
+    return value
+
+
+def get_product(product_id):
+    """Return the product (with its category) or None if it doesn't exist."""
+    return get_or_set(
+        f"product:{product_id}",
+        lambda: (
+            Product.objects.select_related("category")
+            .filter(pk=product_id)
+            .first()
+        ),
+    )
+
+
+def get_product_dict(product, builder):
+    """Return the cached serialised form of ``product`` built by ``builder``."""
+    return get_or_set(f"product_dict:{product.pk}", lambda: builder(product))
+
+
+def get_categories():
+    """Return every category keyed by its name."""
+    return get_or_set(
+        "categories",
+        lambda: {c.name: c for c in Category.objects.all()},
+    )
+
+
+def get_categories_by_name(names):
+    """Return the categories matching ``names``, in the order given."""
+    categories = get_categories()
+    return [categories[name] for name in names if name in categories]
+
+
+def _listing_key(prefix, params):
+    raw = "&".join(f"{name}={value}" for name, value in sorted(params))
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f"{prefix}:{digest}"
+
+
+def get_listing(params, producer):
+    """
+    Return a cached product listing page.
+
+    ``params`` identifies the page (query string plus page size) and
+    ``producer`` evaluates it on a miss.
+    """
+    return get_or_set(_listing_key("listing", params), producer)
+
+
+def get_listing_total(params, producer):
+    """
+    Return the cached product count for a listing.
+
+    ``params`` identifies the filters only, not the cursor, so every page
+    of one listing shares a single count.
+    """
+    return get_or_set(_listing_key("listing_total", params), producer)
@@ -0,0 +1,101 @@
+"""
+ETag / Last-Modified validators for catalog pages.
+
+Catalog pages also render per-visitor state: the navbar bag badge, the
+account menu, "owned" badges, flash messages and (on product detail) a
+CSRF token. The ETag therefore folds that state in, and Last-Modified,
+which cannot describe it, is only offered on the listing to anonymous
+visitors with an empty bag. Product detail embeds a CSRF token tied to the visitor's
+cookie, so it is validated by ETag only (built from product.updated_at).
+Requests with pending messages are never answered with a 304, so
+messages are not lost.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib import messages
+from django.middleware.csrf import CSRF_SESSION_KEY
+
+from checkout.entitlements import entitlements_version
+
+from .cache import get_catalog_last_modified, get_catalog_version, get_product
+
+
+def _csrf_secret(request):
+    if settings.CSRF_USE_SESSIONS:
+        return request.session.get(CSRF_SESSION_KEY, "")
+    return request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+
+
+def _visitor_state(request):
+    """
+    Return a fingerprint of the per-visitor parts of the page, or None if
+    the page must not be served from a client's cache at all.
+    """
+    if len(messages.get_messages(request)):
+        return None
+
+    user = request.user
+    return json.dumps(
+        [
+            user.pk if user.is_authenticated else None,
+            user.is_superuser,
+            entitlements_version(user),
+            request.session.get("bag", {}),
+            _csrf_secret(request),
+        ],
+        sort_keys=True,
+    )
+
+
+def _has_visitor_state(request):
+    return request.user.is_authenticated or bool(request.session.get("bag"))
+
+
+def _etag(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _is_empty_search(request):
+    return "q" in request.GET and not request.GET["q"]
+
+
+def products_etag(request):
+    if _is_empty_search(request):
+        return None
+
+    state = _visitor_state(request)
+    if state is None:
+        return None
+
+    # Without a catalog cache (CATALOG_CACHE_BACKEND=dummy) there is no
+    # version to tell one state of the catalog from the next.
+    version = get_catalog_version()
+    if version is None:
+        return None
+
+    return _etag(version, request.get_full_path(), state)
+
+
+def products_last_modified(request):
+    if _is_empty_search(request) or _has_visitor_state(request):
+        return None
+    if _visitor_state(request) is None:
+        return None
+    return get_catalog_last_modified()
+
+
+def product_detail_etag(request, product_id):
+    product = get_product(product_id)
+    if product is None:
+        return None
+
+    # The purchase form carries a CSRF token; without a secret to tie it
+    # to, a fresh one has to be rendered.
+    state = _visitor_state(request)
+    if state is None or not _csrf_secret(request):
+        return None
+
+    return _etag(product.pk, product.updated_at.isoformat(), state)
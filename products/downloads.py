@@ -0,0 +1,162 @@
+"""
+Delivery of purchased product files.
+
+Django never streams a file from S3 itself. How a file goes out depends on
+where it is stored:
+
+- S3 (PrivateMediaStorage): a redirect to a presigned URL valid for
+  DOWNLOAD_URL_EXPIRY seconds. S3 serves the bytes and handles Range.
+- Local storage behind nginx (DOWNLOAD_ACCEL_REDIRECT_PREFIX set): an
+  X-Accel-Redirect to an internal location; nginx serves the file.
+- Local storage otherwise (development): a FileResponse that honours a
+  single "bytes=" Range, so interrupted downloads can resume.
+
+Products with no file but a download_url redirect there.
+
+Files live in the private storage (products/storage.py), never under
+MEDIA_URL, so this view is the only way to fetch them.
+
+Who may download what comes from the entitlement index; see
+checkout/entitlements.py.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.http import http_date, parse_http_date_safe
+from storages.backends.s3boto3 import S3Boto3Storage
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file."""
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) byte offsets, inclusive, asked for by a Range
+    header, or None to send the whole file (no header, or one we don't
+    serve, such as multiple ranges).
+
+    Raises RangeNotSatisfiable if the range starts past the end of the file.
+    """
+    match = RANGE_PATTERN.match((header or "").replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # "bytes=-500": the last 500 bytes.
+        length = int(last)
+        if not length:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, end
+
+
+class _RangeReader:
+    """File wrapper that reads ``length`` bytes, for FileResponse."""
+
+    block_size = 64 * 1024
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _content_disposition(product):
+    filename = os.path.basename(product.file.name)
+    return f'attachment; filename="{filename}"'
+
+
+def _serve_ranged(request, product):
+    """FileResponse for the file, or the requested part of it."""
+    file = product.file.open("rb")
+    size = product.file.size
+    last_modified = http_date(product.updated_at.timestamp())
+
+    # Resume only if the client's copy is of this version of the file.
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or parse_http_date_safe(if_range) == int(product.updated_at.timestamp()):
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except RangeNotSatisfiable:
+            file.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    content_type = mimetypes.guess_type(product.file.name)[0] or "application/octet-stream"
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response["Content-Length"] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(_RangeReader(file, start, length), status=206, content_type=content_type)
+        response["Content-Length"] = length
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response["Accept-Ranges"] = "bytes"
+    response["Last-Modified"] = last_modified
+    response["Content-Disposition"] = _content_disposition(product)
+    return response
+
+
+def _accel_redirect(product):
+    """Hand the file to nginx, which serves it (and any Range) itself."""
+    response = HttpResponse(
+        content_type=mimetypes.guess_type(product.file.name)[0] or "application/octet-stream"
+    )
+    response["X-Accel-Redirect"] = settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX + product.file.name
+    response["Content-Disposition"] = _content_disposition(product)
+    return response
+
+
+def presigned_url(product):
+    """A short-lived S3 URL that downloads the product's file."""
+    # The private storage always signs, with DOWNLOAD_URL_EXPIRY.
+    return product.file.storage.url(
+        product.file.name,
+        parameters={"ResponseContentDisposition": _content_disposition(product)},
+    )
+
+
+def download_response(request, product):
+    """The response that delivers ``product``'s file, or None if it has none."""
+    if not product.file:
+        if product.download_url:
+            return HttpResponseRedirect(product.download_url)
+        return None
+
+    if isinstance(product.file.storage, S3Boto3Storage):
+        response = HttpResponseRedirect(presigned_url(product))
+    elif settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX:
+        response = _accel_redirect(product)
+    else:
+        response = _serve_ranged(request, product)
+
+    response["Cache-Control"] = "private, no-store"
+    return response
@@ -0,0 +1,36 @@
+"""
+Per-product rendered fragment cache for product cards.
+
+Each card is keyed by product id plus its ``updated_at`` timestamp, so a
+card is re-rendered only after that product (or its category, which
+touches its products) changes. A listing page fetches all of its cards
+with one get_many() and renders only the misses.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = "products/includes/product_card.html"
+
+
+def card_cache_key(product):
+    return f"product_card:{product.pk}:{product.updated_at.timestamp()}"
+
+
+def render_product_cards(products):
+    """Return the card HTML for each product, in order."""
+    cache = caches[settings.CATALOG_CACHE_ALIAS]
+    keys = [card_cache_key(product) for product in products]
+    cards = cache.get_many(keys)
+
+    missing = {}
+    for key, product in zip(keys, products):
+        if key not in cards:
+            missing[key] = render_to_string(CARD_TEMPLATE, {"product": product})
+
+    if missing:
+        cache.set_many(missing, settings.PRODUCT_CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,174 @@
+"""
+Responsive image derivatives for product images.
+
+When a product image is saved, fixed-width resized copies are written next
+to it through the image field's storage (MediaStorage on S3 in
+production) as JPEG, WebP and, where Pillow supports it, AVIF. The
+resulting names are recorded on Product.image_derivatives:
+
+    {
+        "source": "product_images/kit.jpg",
+        "variants": {
+            "avif": [[320, "product_images/derivatives/kit-320w.avif"], ...],
+            "webp": [[320, "product_images/derivatives/kit-320w.webp"], ...],
+            "jpeg": [[320, "product_images/derivatives/kit-320w.jpg"], ...],
+        },
+    }
+
+Templates read them through Product.image_srcset() / image_sources(),
+which ignore derivatives of any other image than the current one.
+
+Encoding is slow, so saving a product only marks its derivatives as
+pending (a "pending" key on the dict). The generate_image_derivatives
+command builds them, continuously with --watch (the "images" process in
+the Procfile).
+"""
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .cache import bump_catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_DIR = "product_images/derivatives"
+
+# format key -> (Pillow format, file extension, save options)
+FORMATS = {
+    "avif": ("AVIF", "avif", {"quality": 55}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 6}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def available_formats():
+    """Formats this Pillow build can encode, best compression first."""
+    return [
+        key for key in FORMATS
+        if key == "jpeg" or features.check(key)
+    ]
+
+
+def _target_widths(source_width):
+    """Configured widths that don't upscale (always at least one)."""
+    widths = sorted(w for w in settings.PRODUCT_IMAGE_WIDTHS if w < source_width)
+    return widths or [source_width]
+
+
+def _delete_derivatives(storage, derivatives):
+    for variants in (derivatives or {}).get("variants", {}).values():
+        for _, name in variants:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning("Could not delete image derivative %s", name)
+
+
+def build_derivatives(product):
+    """
+    Render and store every derivative of ``product.image``.
+
+    Returns the dict to record on Product.image_derivatives.
+    """
+    storage = product.image.storage
+    stem = posixpath.splitext(posixpath.basename(product.image.name))[0]
+
+    with product.image.open("rb") as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    variants = {}
+    for width in _target_widths(image.width):
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        for key in available_formats():
+            pil_format, extension, options = FORMATS[key]
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+
+            name = storage.save(
+                f"{DERIVATIVE_DIR}/{stem}-{width}w.{extension}",
+                ContentFile(buffer.getvalue()),
+            )
+            variants.setdefault(key, []).append([width, name])
+
+    return {"source": product.image.name, "variants": variants}
+
+
+def mark_derivatives_pending(product):
+    """
+    Queue ``product`` for the derivative worker if its image changed.
+    Returns True if it was queued.
+    """
+    current = product.image_derivatives or {}
+    source = product.image.name if product.image else None
+
+    if current.get("pending") or current.get("source") == source:
+        return False
+
+    # Keep the old variants so the worker can delete their files.
+    product.image_derivatives = {**current, "pending": True}
+    Product.objects.filter(pk=product.pk).update(
+        image_derivatives=product.image_derivatives
+    )
+    return True
+
+
+def pending_products():
+    """Products whose derivatives are waiting to be (re)built."""
+    return Product.objects.filter(image_derivatives__has_key="pending")
+
+
+def update_derivatives(product, force=False):
+    """
+    Bring ``product.image_derivatives`` in line with its current image.
+
+    Does nothing when the derivatives were already built from this image,
+    unless ``force`` is set. Returns True if anything changed.
+    """
+    current = product.image_derivatives or {}
+    source = product.image.name if product.image else None
+
+    if not force and not current.get("pending") and current.get("source") == source:
+        return False
+
+    storage = Product._meta.get_field("image").storage
+    derivatives = {}
+    if source:
+        try:
+            derivatives = build_derivatives(product)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            # Recorded without variants so the worker doesn't retry it;
+            # --force tries again.
+            logger.exception("Could not build derivatives for %s", source)
+            derivatives = {"source": source, "variants": {}}
+
+    # update() skips post_save and lets us re-version the product card
+    # fragments in the same statement. Matching on the image skips the
+    # write if it was replaced while we were encoding.
+    unchanged = Q(image=source) if source else Q(image="") | Q(image__isnull=True)
+    updated_at = timezone.now()
+    updated = Product.objects.filter(unchanged, pk=product.pk).update(
+        image_derivatives=derivatives,
+        updated_at=updated_at,
+    )
+    if not updated:
+        _delete_derivatives(storage, derivatives)
+        return False
+
+    _delete_derivatives(storage, current)
+    product.image_derivatives = derivatives
+    product.updated_at = updated_at
+    bump_catalog_version()
+    return True
@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.images import available_formats, pending_products, update_derivatives
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Build responsive image derivatives for products whose image has "
+        "none yet (or for every product with --force). With --watch, keep "
+        "building them for products queued by saves until interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild derivatives even if they are up to date.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=200,
+            help="Products fetched per database round trip.",
+        )
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="After the first pass, poll for queued products instead of exiting.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when nothing is queued (with --watch).",
+        )
+
+    def _build(self, products, force=False, chunk_size=200):
+        updated = 0
+        for product in products.iterator(chunk_size=chunk_size):
+            if update_derivatives(product, force=force):
+                updated += 1
+                self.stdout.write(f"  {product.pk}: {product.image.name}")
+        return updated
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Formats: {', '.join(available_formats())}")
+
+        products = (
+            Product.objects.exclude(image="")
+            .exclude(image__isnull=True)
+            .only("id", "image", "image_derivatives")
+            .order_by("id")
+        )
+        updated = self._build(products, options["force"], options["chunk_size"])
+        # Removed images still have derivative files to clean up.
+        updated += self._build(pending_products().order_by("id"))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Built derivatives for {updated} products.")
+        )
+
+        if not options["watch"]:
+            return
+
+        try:
+            while True:
+                queued = pending_products().only("id", "image", "image_derivatives")
+                if not self._build(queued.order_by("id")):
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
@@ -0,0 +1,209 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from products.cache import bump_catalog_version
+from products.models import Category, Product
+from products.search import get_search_backend
+
+# Feed column -> Product field. "price" is accepted for older feeds.
+DECIMAL_FIELDS = {
+    "price": "price_personal",
+    "price_personal": "price_personal",
+    "price_commercial": "price_commercial",
+    "price_extended": "price_extended",
+    "rating": "rating",
+}
+OPTIONAL_TEXT_FIELDS = ("description", "image_url", "download_url")
+BOOLEAN_VALUES = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False}
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a JSON Lines or CSV feed and upsert them by "
+        "sku in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Feed file, or - to read stdin.")
+        parser.add_argument(
+            "--format",
+            choices=("jsonl", "csv"),
+            help="Feed format (defaults to the file extension).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows written per bulk_create/bulk_update.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        feed_format = options["format"] or self._guess_format(path)
+        batch_size = options["batch_size"]
+
+        self.categories = {c.name: c for c in Category.objects.all()}
+        self.backend = get_search_backend()
+        self.created = self.updated = self.unchanged = self.skipped = 0
+
+        started = time.monotonic()
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            rows = self._read(stream, feed_format)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                self._write_batch(batch)
+
+                elapsed = time.monotonic() - started
+                processed = self.created + self.updated + self.unchanged + self.skipped
+                self.stdout.write(
+                    f"{processed} rows ({processed / max(elapsed, 1e-9):,.0f} rows/s)"
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        # Bulk writes skip model signals, so invalidate the catalog once.
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        processed = self.created + self.updated + self.unchanged + self.skipped
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {processed} rows in {elapsed:.1f}s "
+                f"({processed / max(elapsed, 1e-9):,.0f} rows/s): "
+                f"{self.created} created, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {self.skipped} skipped."
+            )
+        )
+
+    def _guess_format(self, path):
+        if path.endswith(".csv"):
+            return "csv"
+        if path.endswith((".jsonl", ".ndjson")):
+            return "jsonl"
+        raise CommandError("Cannot tell the feed format; pass --format.")
+
+    def _read(self, stream, feed_format):
+        if feed_format == "csv":
+            yield from csv.DictReader(stream)
+            return
+
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                self.stderr.write(f"Line {line_number}: invalid JSON ({e})")
+                yield {}
+
+    def _category(self, name):
+        """Resolve a category by name, creating it on first sight."""
+        if not name:
+            return None
+        category = self.categories.get(name)
+        if category is None:
+            category = Category.objects.create(name=name)
+            self.categories[name] = category
+        return category
+
+    def _clean(self, row):
+        """Return the Product field values for a feed row, or None to skip it."""
+        sku = str(row.get("sku") or "").strip()
+        name = str(row.get("name") or "").strip()
+        if not sku or not name:
+            return None
+
+        values = {"sku": sku, "name": name}
+        for column in OPTIONAL_TEXT_FIELDS:
+            if column in row:
+                # description is NOT NULL; the URL fields are nullable.
+                values[column] = row[column] or ("" if column == "description" else None)
+
+        for column, field in DECIMAL_FIELDS.items():
+            value = row.get(column)
+            if value in (None, ""):
+                continue
+            try:
+                values[field] = Decimal(str(value))
+            except InvalidOperation:
+                return None
+
+        if "is_digital" in row:
+            value = str(row["is_digital"]).strip().lower()
+            values["is_digital"] = BOOLEAN_VALUES.get(value, True)
+
+        if "category" in row:
+            values["category"] = self._category(str(row["category"] or "").strip())
+
+        return values
+
+    def _unchanged(self, product, values):
+        for field, value in values.items():
+            if field == "category":
+                # Compare ids; reading product.category would query.
+                field, value = "category_id", value.pk if value else None
+            if getattr(product, field) != value:
+                return False
+        return True
+
+    def _write_batch(self, rows):
+        cleaned = {}
+        for row in rows:
+            values = self._clean(row) if isinstance(row, dict) else None
+            if values is None:
+                self.skipped += 1
+                continue
+            # Later rows for the same sku win.
+            cleaned[values["sku"]] = values
+
+        if not cleaned:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {
+                p.sku: p for p in Product.objects.filter(sku__in=list(cleaned))
+            }
+
+            to_create = []
+            to_update = []
+            update_fields = {"updated_at"}
+            for sku, values in cleaned.items():
+                product = existing.get(sku)
+                if product is None:
+                    to_create.append(Product(updated_at=now, **values))
+                    continue
+                if self._unchanged(product, values):
+                    # Re-imported unchanged: leave its cards and ETags alone.
+                    self.unchanged += 1
+                    continue
+                for field, value in values.items():
+                    setattr(product, field, value)
+                # auto_now is not applied by bulk_update.
+                product.updated_at = now
+                update_fields.update(values)
+                to_update.append(product)
+
+            created = Product.objects.bulk_create(to_create)
+            if to_update:
+                Product.objects.bulk_update(
+                    to_update, sorted(update_fields), batch_size=500
+                )
+
+            self.backend.index([p.pk for p in created + to_update])
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default="default",
+            help="Database alias to rebuild the index on.",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        backend = get_search_backend(using)
+        backend.rebuild()
+
+        count = Product.objects.using(using).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {type(backend).__name__} index for {count} products."
+            )
+        )
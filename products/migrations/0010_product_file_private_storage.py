@@ -0,0 +1,42 @@
+# Generated by Django 5.2.11 on 2026-10-16 22:29
+
+import products.storage
+from django.core.files.storage import storages
+from django.db import migrations, models
+
+
+def move_files_to_private_storage(apps, schema_editor):
+    """Move existing product files out of public media."""
+    Product = apps.get_model("products", "Product")
+    public = storages["default"]
+    private = products.storage.private_storage
+
+    names = (
+        Product.objects.exclude(file="")
+        .exclude(file__isnull=True)
+        .values_list("file", flat=True)
+    )
+    for name in names.iterator():
+        if private.exists(name) or not public.exists(name):
+            continue
+        with public.open(name, "rb") as source:
+            saved = private.save(name, source)
+        if saved != name:
+            Product.objects.filter(file=name).update(file=saved)
+        public.delete(name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=products.storage.get_private_storage, upload_to='digital_products/'),
+        ),
+        migrations.RunPython(move_files_to_private_storage, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
 from decimal import Decimal
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from .storage import get_private_storage
+
 
 class Category(models.Model):
     name = models.CharField(max_length=254)
@@ -31,7 +35,8 @@ class Product(models.Model):
         related_name="products",
     )
 
-    sku = models.CharField(max_length=254, null=True, blank=True)
+    # Unique so imports can upsert by it; NULLs (no sku) may repeat.
+    sku = models.CharField(max_length=254, null=True, blank=True, unique=True)
     name = models.CharField(max_length=254)
     description = models.TextField(blank=True)
 
@@ -68,14 +73,39 @@ class Product(models.Model):
     # -----------------------------
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(upload_to="product_images/", null=True, blank=True)
+    # Resized JPEG/WebP/AVIF copies of `image`; see products/images.py.
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     # -----------------------------
     # Digital Product Fields
     # -----------------------------
     is_digital = models.BooleanField(default=True)
-    file = models.FileField(upload_to="digital_products/", null=True, blank=True)
+    # Paid files: private storage, delivered only by the download view.
+    file = models.FileField(
+        upload_to="digital_products/",
+        storage=get_private_storage,
+        null=True,
+        blank=True,
+    )
     download_url = models.URLField(max_length=1024, null=True, blank=True)
 
+    # -----------------------------
+    # Search
+    # -----------------------------
+    # Only populated on PostgreSQL (GIN-indexed); SQLite uses an FTS5
+    # table instead. See products/search.py.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Bumped on every save; versions cached per-product fragments.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # GIN on PostgreSQL; SQLite ignores the method and builds a plain
+            # index on the (always empty) column.
+            GinIndex(fields=["search_vector"], name="product_search_vector_gin"),
+        ]
+
     # -----------------------------
     # Utility Methods
     # -----------------------------
@@ -93,5 +123,36 @@ class Product(models.Model):
 
         return self.price_personal
 
+    def _image_variants(self):
+        """Derivatives of the current image (none while they are rebuilt)."""
+        derivatives = self.image_derivatives or {}
+        if not self.image or derivatives.get("source") != self.image.name:
+            return {}
+        return derivatives.get("variants", {})
+
+    def image_srcset(self, image_format="jpeg"):
+        """
+        Return a srcset string ("<url> 320w, <url> 640w") for one
+        derivative format, or "" if none have been generated.
+        """
+        variants = self._image_variants()
+        storage = self.image.storage
+        return ", ".join(
+            f"{storage.url(name)} {width}w"
+            for width, name in variants.get(image_format, [])
+        )
+
+    def image_sources(self):
+        """
+        Return the <source> entries for a <picture> element, best format
+        first, e.g. [{"type": "image/avif", "srcset": "..."}].
+        """
+        variants = self._image_variants()
+        return [
+            {"type": f"image/{image_format}", "srcset": self.image_srcset(image_format)}
+            for image_format in ("avif", "webp")
+            if variants.get(image_format)
+        ]
+
     def __str__(self):
         return self.name
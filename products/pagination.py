@@ -0,0 +1,109 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+@dataclass
+class KeysetPage:
+    """One page of results plus the cursor needed to fetch the next one."""
+
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """Encode the sort values of the last row as an opaque URL-safe cursor."""
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(). Returns None if it is invalid."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        return None
+    return values
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a queryset.
+
+    Rows are ordered by an optional, non-null sort expression and then by
+    ``id`` as a stable tie-breaker. Each page is fetched with a
+    ``WHERE (sort_key, id) > (last_key, last_id)`` style filter instead of
+    an OFFSET, so page N costs the same as page 1.
+    """
+
+    annotation = "sort_key"
+
+    def __init__(self, queryset, sort_expression=None, descending=False, per_page=24):
+        self.sort_expression = sort_expression
+        self.descending = descending
+        self.per_page = per_page
+
+        if sort_expression is not None:
+            queryset = queryset.annotate(**{self.annotation: sort_expression})
+        self.queryset = queryset.order_by(*self._ordering())
+
+    def _ordering(self):
+        prefix = "-" if self.descending else ""
+        fields = ["id"]
+        if self.sort_expression is not None:
+            fields.insert(0, self.annotation)
+        return [f"{prefix}{name}" for name in fields]
+
+    def _after(self, values):
+        """Build the filter selecting rows strictly after the cursor position."""
+        op = "lt" if self.descending else "gt"
+
+        if self.sort_expression is None:
+            return Q(**{f"id__{op}": values[-1]})
+
+        key_value, last_id = values
+        return Q(**{f"{self.annotation}__{op}": key_value}) | Q(
+            **{self.annotation: key_value, f"id__{op}": last_id}
+        )
+
+    def _cursor_for(self, row):
+        values = [row.id]
+        if self.sort_expression is not None:
+            values.insert(0, getattr(row, self.annotation))
+        return encode_cursor(values)
+
+    def page(self, cursor=None):
+        """Return the page that follows ``cursor`` (the first page if None)."""
+        queryset = self.queryset
+        values = decode_cursor(cursor)
+        expected = 1 if self.sort_expression is None else 2
+
+        if values is not None and len(values) == expected:
+            try:
+                queryset = queryset.filter(self._after(values))
+            except (ValidationError, ValueError, TypeError):
+                # Tampered or stale cursor: fall back to the first page.
+                queryset = self.queryset
+
+        # Fetch one extra row to learn whether there is a next page.
+        rows = list(queryset[:self.per_page + 1])
+        items = rows[:self.per_page]
+
+        next_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = self._cursor_for(items[-1])
+
+        return KeysetPage(items=items, next_cursor=next_cursor)
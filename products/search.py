@@ -0,0 +1,191 @@
+"""
+Full-text search backends for the product catalog.
+
+The backend is chosen from the database vendor:
+
+- SQLite (local): an FTS5 virtual table, ranked with bm25().
+- PostgreSQL (DATABASE_URL): the Product.search_vector tsvector column,
+  backed by a GIN index and ranked with ts_rank().
+- Anything else: the original icontains scan, unranked.
+
+Every backend annotates matching products with ``search_rank`` and keeps
+its index up to date through ``index()``/``remove()``, which are called
+from the Product post_save/post_delete signals (see products/signals.py).
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+FTS_TABLE = "products_product_fts"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(query):
+    """Split free text into safe word tokens (no query syntax survives)."""
+    return TOKEN_RE.findall(query or "")
+
+
+class IContainsSearchBackend:
+    """Fallback: substring scan over name/description with no ranking."""
+
+    # Lower rank sorts first unless this is True.
+    rank_descending = False
+
+    def __init__(self, using="default"):
+        self.using = using
+
+    def search(self, queryset, query):
+        queries = Q(name__icontains=query) | Q(description__icontains=query)
+        return queryset.filter(queries).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    def index(self, product_ids):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSSearchBackend(IContainsSearchBackend):
+    """SQLite FTS5 index stored in a separate virtual table keyed by rowid."""
+
+    rank_descending = False  # bm25() is negative; more relevant is lower
+
+    # Column weights for bm25(): a name hit outranks a description hit.
+    weights = (10.0, 1.0)
+
+    def _match(self, query):
+        # Quote every token and make it a prefix so partial words still
+        # match, like the icontains search did.
+        return " ".join(f'"{term}"*' for term in search_terms(query))
+
+    def search(self, queryset, query):
+        match = self._match(query)
+        if not match:
+            return queryset.none()
+
+        table = Product._meta.db_table
+        weights = ", ".join(str(w) for w in self.weights)
+        rank = RawSQL(
+            f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+            (match,),
+            output_field=FloatField(),
+        )
+        matches = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            (match,),
+        )
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+
+        table = Product._meta.db_table
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids,
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM {table} "
+                f"WHERE id IN ({placeholders})",
+                product_ids,
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids,
+            )
+
+    def rebuild(self):
+        table = Product._meta.db_table
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM {table}"
+            )
+
+
+class PostgresSearchBackend(IContainsSearchBackend):
+    """tsvector column on Product with a GIN index, ranked by ts_rank()."""
+
+    rank_descending = True  # ts_rank() is higher for better matches
+
+    @property
+    def config(self):
+        return getattr(settings, "PRODUCT_SEARCH_CONFIG", "english")
+
+    def _vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return (
+            SearchVector("name", weight="A", config=self.config)
+            + SearchVector("description", weight="B", config=self.config)
+        )
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+
+        # Prefix-match every term, AND-ed together (raw tsquery syntax is
+        # safe here because terms are plain word characters).
+        search_query = SearchQuery(
+            " & ".join(f"{term}:*" for term in terms),
+            search_type="raw",
+            config=self.config,
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F("search_vector"), search_query)
+        )
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            Product.objects.using(self.using).filter(pk__in=product_ids).update(
+                search_vector=self._vector()
+            )
+
+    def remove(self, product_ids):
+        # The vector lives on the product row, so it goes with it.
+        pass
+
+    def rebuild(self):
+        Product.objects.using(self.using).update(search_vector=self._vector())
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(using="default"):
+    """Return the search backend matching the database behind ``using``."""
+    vendor = connections[using].vendor
+    return BACKENDS.get(vendor, IContainsSearchBackend)(using=using)
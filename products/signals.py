@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .images import mark_derivatives_pending
+from .models import Category, Product
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_save(sender, instance, using, **kwargs):
+    """
+    Re-index the product for full-text search
+    """
+    get_search_backend(using).index([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_delete(sender, instance, using, **kwargs):
+    """
+    Drop the product from the full-text search index
+    """
+    get_search_backend(using).remove([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Bump the catalog version so every cached catalog entry is refreshed
+    """
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_category_products(sender, instance, **kwargs):
+    """
+    Cards show the category name, so re-version its products' card fragments
+    """
+    Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def update_image_derivatives(sender, instance, raw, update_fields, **kwargs):
+    """
+    Queue responsive image derivatives when the product image changes
+    """
+    if raw or (update_fields and "image" not in update_fields):
+        return
+    mark_derivatives_pending(instance)
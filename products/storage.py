@@ -0,0 +1,33 @@
+"""
+Storage for purchased product files (Product.file).
+
+Paid files live in the "private" entry of settings.STORAGES, apart from
+public media: a directory outside MEDIA_ROOT locally, and a private S3
+location in production (custom_storages.PrivateMediaStorage). They are
+only ever delivered by the download view; see products/downloads.py.
+"""
+from django.core.files.storage import storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+PRIVATE_STORAGE_ALIAS = "private"
+
+
+class PrivateStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = storages[PRIVATE_STORAGE_ALIAS]
+
+
+private_storage = PrivateStorage()
+
+
+def get_private_storage():
+    """Storage callable for Product.file (keeps migrations backend-free)."""
+    return private_storage
+
+
+@receiver(setting_changed)
+def _reset_on_setting_changed(setting, **kwargs):
+    if setting == "STORAGES":
+        private_storage._wrapped = empty
@@ -1,3 +1,738 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from PIL import Image
+
+from checkout.entitlements import grant_entitlements, user_owns_product
+from checkout.models import Order, OrderLineItem
+from checkout.utils import get_or_create_order
+from design_dock.admin_pagination import EstimatedCountPaginator
+
+from .cache import bump_catalog_version
+from .fragments import render_product_cards
+from .images import available_formats, update_derivatives
+from .models import Category, Product
+
+
+@override_settings(PRODUCTS_PER_PAGE=4)
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        kits = Category.objects.create(name="kits", friendly_name="Kits")
+        icons = Category.objects.create(name="icons", friendly_name="Icons")
+
+        # Repeated prices, names and ratings force tie-breaking on id.
+        for i in range(11):
+            Product.objects.create(
+                name=f"Template {i % 3}",
+                sku=f"sku-{i}",
+                category=kits if i % 2 else icons if i % 5 else None,
+                price_personal=Decimal("10.00") + (i % 4),
+                rating=None if i % 3 == 0 else Decimal("4.50"),
+            )
+
+    def _walk(self, params):
+        """Follow next_cursor through the JSON listing, collecting ids."""
+        ids = []
+        cursor = None
+        while True:
+            query = dict(params)
+            if cursor:
+                query["cursor"] = cursor
+            data = self.client.get(reverse("products_page"), query).json()
+            ids.extend(card["id"] for card in data["results"])
+            cursor = data["next_cursor"]
+            if not data["has_next"]:
+                return ids
+
+    def test_every_sort_visits_each_product_exactly_once(self):
+        expected = sorted(Product.objects.values_list("id", flat=True))
+
+        for sort in ("price", "rating", "name", "category", None):
+            for direction in ("asc", "desc"):
+                params = {"direction": direction}
+                if sort:
+                    params["sort"] = sort
+                with self.subTest(sort=sort, direction=direction):
+                    ids = self._walk(params)
+                    self.assertEqual(len(ids), len(expected))
+                    self.assertEqual(sorted(ids), expected)
+
+    def test_pages_follow_requested_order(self):
+        ids = self._walk({"sort": "price", "direction": "desc"})
+        prices = [Product.objects.get(pk=pk).price_personal for pk in ids]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+    def test_filters_apply_across_pages(self):
+        ids = self._walk({"category": "kits", "q": "Template 1"})
+        expected = Product.objects.filter(
+            category__name="kits", name__icontains="Template 1"
+        )
+        self.assertEqual(sorted(ids), sorted(p.id for p in expected))
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        first = self.client.get(reverse("products_page")).json()
+        bad = self.client.get(reverse("products_page"), {"cursor": "!!"}).json()
+        self.assertEqual(first["results"], bad["results"])
+
+    def test_html_listing_renders_one_page(self):
+        response = self.client.get(reverse("products"), {"sort": "name"})
+        self.assertEqual(len(response.context["products"]), 4)
+        self.assertEqual(response.context["product_total"], 11)
+        self.assertTrue(response.context["page"].has_next)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.in_name = Product.objects.create(
+            name="Dashboard UI kit", description="Cards and charts."
+        )
+        self.in_description = Product.objects.create(
+            name="Admin bundle", description="Includes a dashboard layout."
+        )
+        Product.objects.create(name="Icon pack", description="Line icons.")
+
+    def _search(self, q):
+        response = self.client.get(reverse("products_page"), {"q": q})
+        return [card["id"] for card in response.json()["results"]]
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(
+            self._search("dashboard"),
+            [self.in_name.id, self.in_description.id],
+        )
+
+    def test_partial_words_match(self):
+        self.assertEqual(self._search("dashb"), self._search("dashboard"))
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self._search('"icon*) -'), self._search("icon"))
+
+    def test_index_follows_save_and_delete(self):
+        self.in_name.name = "Analytics UI kit"
+        self.in_name.description = ""
+        self.in_name.save()
+        self.assertEqual(self._search("analytics"), [self.in_name.id])
+        self.assertEqual(self._search("dashboard"), [self.in_description.id])
+
+        self.in_description.delete()
+        self.assertEqual(self._search("dashboard"), [])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="kits", friendly_name="Kits")
+        self.product = Product.objects.create(name="UI kit", category=self.category)
+
+    def test_product_detail_is_served_from_cache(self):
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "UI kit")
+
+    def test_saving_a_product_invalidates_the_cache(self):
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)
+
+        self.product.name = "Renamed kit"
+        self.product.save()
+        self.assertContains(self.client.get(url), "Renamed kit")
+
+    def test_category_changes_invalidate_listings(self):
+        url = reverse("products") + "?category=kits"
+        self.client.get(url)
+
+        self.category.friendly_name = "Starter kits"
+        self.category.save()
+        self.assertContains(self.client.get(url), "Starter kits")
+
+    def test_unknown_parameters_share_the_cached_listing(self):
+        self.client.get(reverse("products"), {"category": "kits"})
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("products"), {"category": "kits", "x": "1"})
+        self.assertContains(response, "UI kit")
+
+    def test_deleted_product_is_not_served(self):
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)
+
+        self.product.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ProductGridQueryTests(TestCase):
+    """The listing costs a fixed number of queries whatever the catalog size."""
+
+    def _populate(self, count):
+        categories = [
+            Category.objects.create(name=f"cat-{i}", friendly_name=f"Cat {i}")
+            for i in range(3)
+        ]
+        for i in range(count):
+            Product.objects.create(
+                name=f"Template {i}",
+                description="x" * 2000,
+                category=categories[i % 3],
+            )
+
+    def _assert_listing_queries(self, url, expected):
+        # Start from a cold catalog cache so the database path is measured.
+        bump_catalog_version()
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_is_independent_of_catalog_size(self):
+        for count in (3, 40):
+            with self.subTest(count=count):
+                Product.objects.all().delete()
+                Category.objects.all().delete()
+                self._populate(count)
+
+                # Page of cards (category joined) + total count.
+                self._assert_listing_queries(reverse("products"), 2)
+                self._assert_listing_queries(
+                    reverse("products") + "?sort=category&direction=desc", 2
+                )
+                # + the category lookup for the selected-category badges.
+                self._assert_listing_queries(
+                    reverse("products") + "?category=cat-1,cat-2", 3
+                )
+
+    def test_listing_defers_description(self):
+        self._populate(2)
+        response = self._assert_listing_queries(reverse("products"), 2)
+        product = response.context["products"][0]
+        self.assertIn("description", product.get_deferred_fields())
+
+    @override_settings(PRODUCTS_PER_PAGE=2)
+    def test_later_pages_reuse_the_total_count(self):
+        self._populate(5)
+        first = self.client.get(reverse("products"), {"sort": "name"})
+        cursor = first.context["page"].next_cursor
+
+        # Only the keyset query for the new page; the count is shared.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("products"), {"sort": "name", "cursor": cursor})
+        self.assertEqual(response.context["product_total"], 5)
+
+    def test_warm_listing_needs_no_queries(self):
+        self._populate(5)
+        url = reverse("products") + "?category=cat-1"
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+
+class ProductCardFragmentTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="kits", friendly_name="Kits")
+        self.product = Product.objects.create(name="UI kit", category=self.category)
+
+    def _render(self):
+        product = Product.objects.select_related("category").get(pk=self.product.pk)
+        with mock.patch(
+            "products.fragments.render_to_string", wraps=render_to_string
+        ) as render:
+            cards = render_product_cards([product])
+        return cards[0], render.call_count
+
+    def test_cards_are_rendered_once_per_product_version(self):
+        html, renders = self._render()
+        self.assertEqual(renders, 1)
+        self.assertIn("UI kit", html)
+
+        html, renders = self._render()
+        self.assertEqual(renders, 0)
+
+        self.product.name = "Renamed kit"
+        self.product.save()
+        html, renders = self._render()
+        self.assertEqual(renders, 1)
+        self.assertIn("Renamed kit", html)
+
+    def test_category_rename_refreshes_its_cards(self):
+        self._render()
+
+        self.category.friendly_name = "Starter kits"
+        self.category.save()
+        html, renders = self._render()
+        self.assertEqual(renders, 1)
+        self.assertIn("Starter kits", html)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="UI kit")
+
+    def _revalidate(self, url):
+        etag = self.client.get(url)["ETag"]
+        return self.client.get(url, headers={"if-none-match": etag})
+
+    def test_unchanged_listing_returns_304(self):
+        response = self._revalidate(reverse("products"))
+        self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_listing_honours_if_modified_since(self):
+        last_modified = self.client.get(reverse("products"))["Last-Modified"]
+        response = self.client.get(
+            reverse("products"), headers={"if-modified-since": last_modified}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_invalidates_listing(self):
+        url = reverse("products")
+        etag = self.client.get(url)["ETag"]
+
+        Product.objects.create(name="Icon pack")
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(
+        CACHES={
+            **settings.CACHES,
+            settings.CATALOG_CACHE_ALIAS: {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        }
+    )
+    def test_listing_without_a_catalog_cache_is_not_validated(self):
+        response = self.client.get(reverse("products"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_bag_change_invalidates_listing(self):
+        url = reverse("products")
+        etag = self.client.get(url)["ETag"]
+
+        session = self.client.session
+        session["bag"] = {str(self.product.id): {"items_by_license": {"personal": 1}}}
+        session.save()
+
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_product_detail_revalidates_against_product_version(self):
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)  # receives the CSRF cookie the form needs
+
+        self.assertEqual(self._revalidate(url).status_code, 304)
+
+        etag = self.client.get(url)["ETag"]
+        self.product.save()
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_detail_without_csrf_cookie_is_always_rendered(self):
+        url = reverse("product_detail", args=[self.product.id])
+        response = self.client.get(url)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=media_root,
+            STORAGES={
+                "default": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                },
+                "staticfiles": {
+                    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+                },
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _upload(self, width=800, height=600):
+        buffer = io.BytesIO()
+        Image.new("RGB", (width, height), "teal").save(buffer, "JPEG")
+        return SimpleUploadedFile("kit.jpg", buffer.getvalue(), "image/jpeg")
+
+    def _build(self):
+        call_command("generate_image_derivatives", stdout=io.StringIO())
+
+    def test_saving_an_image_queues_derivatives(self):
+        with mock.patch("products.images.build_derivatives") as build:
+            product = Product.objects.create(name="UI kit", image=self._upload())
+        build.assert_not_called()
+        product.refresh_from_db()
+        self.assertTrue(product.image_derivatives["pending"])
+        self.assertEqual(product.image_srcset(), "")
+
+        self._build()
+        product.refresh_from_db()
+
+        variants = product.image_derivatives["variants"]
+        self.assertNotIn("pending", product.image_derivatives)
+        self.assertEqual(product.image_derivatives["source"], product.image.name)
+        self.assertEqual([w for w, _ in variants["jpeg"]], [320, 640])
+        for image_format in available_formats():
+            for width, name in variants[image_format]:
+                with product.image.storage.open(name) as stored:
+                    self.assertEqual(Image.open(stored).width, width)
+
+        self.assertIn("320w", product.image_srcset())
+        self.assertEqual(
+            [source["type"] for source in product.image_sources()],
+            [f"image/{f}" for f in ("avif", "webp") if f in variants],
+        )
+
+    def test_unchanged_image_is_not_reprocessed(self):
+        product = Product.objects.create(name="UI kit", image=self._upload())
+        self._build()
+        product.refresh_from_db()
+        derivatives = product.image_derivatives
+
+        product.name = "Renamed kit"
+        product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, derivatives)
+
+    def test_replacing_the_image_replaces_derivatives(self):
+        product = Product.objects.create(name="UI kit", image=self._upload())
+        self._build()
+        product.refresh_from_db()
+        old_names = [n for _, n in product.image_derivatives["variants"]["jpeg"]]
+
+        product.image = self._upload(width=400, height=300)
+        product.save()
+        # Stale derivatives are not served while the new ones are queued.
+        self.assertEqual(product.image_srcset(), "")
+        self._build()
+        product.refresh_from_db()
+
+        self.assertEqual(
+            [w for w, _ in product.image_derivatives["variants"]["jpeg"]], [320]
+        )
+        for name in old_names:
+            self.assertFalse(product.image.storage.exists(name))
+
+    def test_oversized_images_are_skipped(self):
+        product = Product.objects.create(name="UI kit", image=self._upload())
+
+        with mock.patch(
+            "products.images.build_derivatives",
+            side_effect=Image.DecompressionBombError("too big"),
+        ), self.assertLogs("products.images", "ERROR"):
+            self._build()
+        product.refresh_from_db()
+
+        self.assertEqual(product.image_derivatives["variants"], {})
+        self.assertEqual(product.image_derivatives["source"], product.image.name)
+        self.assertFalse(update_derivatives(product))
+
+    def test_backfill_command(self):
+        product = Product.objects.create(name="UI kit", image=self._upload())
+        Product.objects.filter(pk=product.pk).update(image_derivatives={})
+
+        self._build()
+        product.refresh_from_db()
+        self.assertIn("jpeg", product.image_derivatives["variants"])
+
+
+class ImportProductsCommandTests(TestCase):
+    def _feed(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile(
+            "w", suffix=suffix, delete=False, encoding="utf-8"
+        )
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def _import(self, path, *args):
+        out = io.StringIO()
+        call_command("import_products", path, *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_jsonl_feed_upserts_by_sku_in_batches(self):
+        Product.objects.create(sku="kit-1", name="Old name", description="Keep")
+        rows = [
+            {"sku": f"kit-{i}", "name": f"Kit {i}", "price_personal": "12.50",
+             "category": "kits" if i % 2 else "icons", "rating": 4.5}
+            for i in range(1, 8)
+        ]
+        rows.append({"sku": "", "name": "No sku"})
+        feed = self._feed(".jsonl", "\n".join(json.dumps(r) for r in rows) + "\nnot json\n")
+
+        output = self._import(feed, "--batch-size", "3")
+
+        self.assertIn("1 updated", output)
+        self.assertIn("6 created", output)
+        self.assertIn("2 skipped", output)
+        self.assertEqual(Product.objects.count(), 7)
+
+        updated = Product.objects.get(sku="kit-1")
+        self.assertEqual(updated.name, "Kit 1")
+        self.assertEqual(updated.description, "Keep")
+        self.assertEqual(updated.price_personal, Decimal("12.50"))
+        self.assertEqual(updated.category.name, "kits")
+        self.assertEqual(Category.objects.count(), 2)
+
+    def test_csv_feed_and_search_index(self):
+        feed = self._feed(
+            ".csv",
+            "sku,name,description,price,is_digital\n"
+            "kit-1,Dashboard kit,Charts,19.99,yes\n"
+            "kit-2,Icon pack,Line icons,5,no\n",
+        )
+        self._import(feed)
+
+        product = Product.objects.get(sku="kit-2")
+        self.assertEqual(product.price_personal, Decimal("5"))
+        self.assertFalse(product.is_digital)
+
+        response = self.client.get(reverse("products_page"), {"q": "dashboard"})
+        self.assertEqual(
+            [card["id"] for card in response.json()["results"]],
+            [Product.objects.get(sku="kit-1").id],
+        )
+
+        # Re-importing the same feed leaves the rows (and their cards) alone.
+        updated_at = product.updated_at
+        self.assertIn("2 unchanged", self._import(feed))
+        product.refresh_from_db()
+        self.assertEqual(product.updated_at, updated_at)
+
+
+class ProductAdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pw"))
+        self.kit = Product.objects.create(
+            name="Dashboard kit", sku="KIT-1", description="Charts and tables"
+        )
+        self.icons = Product.objects.create(name="Icon pack", sku="ICN-1", description="Line icons")
+
+    def _search(self, term):
+        response = self.client.get(reverse("admin:products_product_changelist"), {"q": term})
+        return list(response.context["cl"].result_list)
+
+    def test_search_uses_the_index_and_exact_sku(self):
+        self.assertEqual(self._search("charts"), [self.kit])
+        self.assertEqual(self._search("icon"), [self.icons])
+        self.assertEqual(self._search("ICN-1"), [self.icons])
+
+    def test_estimated_count_only_for_large_unfiltered_tables(self):
+        paginator = EstimatedCountPaginator(Product.objects.order_by("pk"), 10)
+        self.assertEqual(paginator.count, 2)  # SQLite: exact count
+
+        with mock.patch.object(EstimatedCountPaginator, "_estimate", return_value=2_000_000):
+            self.assertEqual(EstimatedCountPaginator(Product.objects.order_by("pk"), 10).count, 2_000_000)
+        with mock.patch.object(EstimatedCountPaginator, "_estimate", return_value=50):
+            self.assertEqual(EstimatedCountPaginator(Product.objects.order_by("pk"), 10).count, 2)
+
+
+class DownloadTests(TestCase):
+    payload = b"0123456789abcdef"
+
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.media_root = tempfile.mkdtemp()
+        private_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, private_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={
+                "default": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                },
+                "staticfiles": {
+                    "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+                },
+                "private": {
+                    "BACKEND": "django.core.files.storage.FileSystemStorage",
+                    "OPTIONS": {"location": private_root, "base_url": "/private-media/"},
+                },
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        os.makedirs(os.path.join(private_root, "digital_products"))
+        with open(os.path.join(private_root, "digital_products", "pack.zip"), "wb") as f:
+            f.write(self.payload)
+        self.product = Product.objects.create(name="Pack", sku="pack", file="digital_products/pack.zip")
+        self.url = reverse("download_product", args=[self.product.pk])
+
+        self.owner = User.objects.create_user("owner")
+        order = Order.objects.create(
+            user_profile=self.owner.userprofile,
+            full_name="Owner",
+            email="owner@example.com",
+            phone_number="1",
+            country="GB",
+            town_or_city="London",
+            street_address1="1 High Street",
+        )
+        OrderLineItem.objects.create(order=order, product=self.product, quantity=1)
+        grant_entitlements(order)
+        self.client.force_login(self.owner)
+
+    def _content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_only_owners_can_download(self):
+        self.client.force_login(User.objects.create_user("someone"))
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse("product_detail", args=[self.product.pk]))
+
+    def test_files_are_kept_out_of_public_media(self):
+        self.assertFalse(self.product.file.url.startswith(settings.MEDIA_URL))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, self.product.file.name)))
+
+        uploaded = Product.objects.create(
+            name="Upload", file=SimpleUploadedFile("upload.zip", self.payload)
+        )
+        self.assertEqual(os.listdir(self.media_root), [])
+        with uploaded.file.open("rb") as stored:
+            self.assertEqual(stored.read(), self.payload)
+
+    def test_owner_gets_the_whole_file(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._content(response), self.payload)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="pack.zip"')
+
+    def test_range_requests_resume_the_download(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=4-7")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self._content(response), b"4567")
+        self.assertEqual(response["Content-Range"], "bytes 4-7/16")
+        self.assertEqual(response["Content-Length"], "4")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(self._content(response), b"def")
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-")
+        self.assertEqual(self._content(response), b"abcdef")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=16-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */16")
+
+    def test_if_range_for_an_older_version_sends_the_whole_file(self):
+        stale = http_date(self.product.updated_at.timestamp() - 60)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=4-7", HTTP_IF_RANGE=stale)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._content(response), self.payload)
+
+    @override_settings(DOWNLOAD_ACCEL_REDIRECT_PREFIX="/protected/")
+    def test_accel_redirect_hands_off_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/digital_products/pack.zip")
+        self.assertEqual(response.content, b"")
+
+    @override_settings(
+        AWS_STORAGE_BUCKET_NAME="design-dock",
+        AWS_S3_REGION_NAME="eu-west-1",
+        AWS_ACCESS_KEY_ID="AKIATEST",
+        AWS_SECRET_ACCESS_KEY="secret",
+        AWS_S3_CUSTOM_DOMAIN="design-dock.s3.amazonaws.com",
+        STORAGES={
+            "default": {"BACKEND": "custom_storages.MediaStorage"},
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            "private": {
+                "BACKEND": "custom_storages.PrivateMediaStorage",
+                "OPTIONS": {"querystring_expire": 300},
+            },
+        },
+    )
+    def test_s3_files_redirect_to_a_presigned_url(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 302)
+        location = response["Location"]
+        self.assertIn("/private/digital_products/pack.zip?", location)
+        self.assertIn("X-Amz-Signature=", location)
+        self.assertIn("X-Amz-Expires=300", location)
+        self.assertIn("response-content-disposition=attachment", location)
+
+    @override_settings(ENTITLEMENT_CACHE_ENABLED=True)
+    def test_entitlements_are_cached(self):
+        self.assertTrue(user_owns_product(self.owner, self.product.pk))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(user_owns_product(self.owner, self.product.pk))
+        self.assertEqual(len(queries), 0)
+
+
+class OwnedBadgeTests(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        bump_catalog_version()
+        self.kit = Product.objects.create(name="Kit", sku="kit")
+        self.icons = Product.objects.create(name="Icons", sku="icons")
+        self.buyer = User.objects.create_user("buyer")
+        self.client.force_login(self.buyer)
+
+    def _buy(self, product, pid):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_or_create_order(
+                pid,
+                {
+                    "user_profile": self.buyer.userprofile,
+                    "full_name": "Buyer",
+                    "email": "buyer@example.com",
+                    "phone_number": "1",
+                    "country": "GB",
+                    "town_or_city": "London",
+                    "street_address1": "1 High Street",
+                },
+                {str(product.id): {"items_by_license": {"commercial": 1}}},
+            )
+
+    def test_listing_and_detail_flag_owned_products(self):
+        self._buy(self.kit, "pi_1")
+
+        response = self.client.get(reverse("products"))
+        owned = [owned for _, owned in response.context["product_cards"]]
+        self.assertEqual(
+            dict(zip([p.pk for p in response.context["products"]], owned)),
+            {self.kit.pk: True, self.icons.pk: False},
+        )
+        data = self.client.get(reverse("products_page")).json()
+        self.assertEqual({c["id"]: c["owned"] for c in data["results"]}, {self.kit.pk: True, self.icons.pk: False})
+
+        response = self.client.get(reverse("product_detail", args=[self.kit.pk]))
+        self.assertContains(response, "You own this")
+        self.assertContains(response, "Commercial")
+
+        # The shared card fragment never carries the badge.
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse("products")), "Owned")
+
+    def test_a_purchase_changes_the_listing_etag(self):
+        url = reverse("products")
+        etag = self.client.get(url)["ETag"]
+
+        self._buy(self.icons, "pi_1")
+
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Owned")
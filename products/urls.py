@@ -3,7 +3,9 @@ from . import views
 
 urlpatterns = [
     path("", views.all_products, name="products"),
+    path("page/", views.products_page, name="products_page"),
     path("<int:product_id>/", views.product_detail, name="product_detail"),
+    path("<int:product_id>/download/", views.download_product, name="download_product"),
     path("add/", views.add_product, name="add_product"),
     path("edit/<int:product_id>/", views.edit_product, name="edit_product"),
 ]
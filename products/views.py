@@ -1,54 +1,106 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q
-from django.db.models.functions import Lower
-
-from .models import Product, Category
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Coalesce, Lower
+from django.http import Http404, JsonResponse
+from django.templatetags.static import static
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from .conditional import (
+    product_detail_etag,
+    products_etag,
+    products_last_modified,
+)
+from .cache import (
+    get_categories_by_name,
+    get_listing,
+    get_listing_total,
+    get_product,
+    get_product_dict,
+)
+from .downloads import download_response
+from .models import Product
 from .forms import ProductForm
+from .fragments import render_product_cards
+from .pagination import KeysetPaginator
+from .search import get_search_backend
 
 from django.contrib.auth.decorators import login_required
 
-
-def all_products(request):
-    """A view to show all products, including sorting and search queries"""
-
-    products = Product.objects.all()
+from checkout.entitlements import owned_products, user_owns_product
+
+
+# Columns the product card (HTML and JSON) reads. Everything else, notably
+# the description, stays deferred on listing pages.
+PRODUCT_CARD_FIELDS = (
+    'id',
+    'name',
+    'price_personal',
+    'rating',
+    'image',
+    'image_derivatives',
+    'category__name',
+    'category__friendly_name',
+    'updated_at',
+)
+
+# Non-null sort expressions for keyset pagination; ties break on id.
+SORT_EXPRESSIONS = {
+    'price': lambda: F('price_personal'),
+    'rating': lambda: Coalesce(
+        'rating', Value(Decimal('-1.00')), output_field=DecimalField()
+    ),
+    'name': lambda: Lower('name'),
+    'category': lambda: Coalesce('category__name', Value('')),
+}
+
+
+# Query parameters _product_listing reads (besides the cursor).
+LISTING_PARAMS = ('sort', 'direction', 'q', 'category')
+
+
+def _product_listing(request):
+    """
+    Apply the sort, search and category query parameters.
+
+    Returns the paginator for the filtered products plus the template
+    context describing the current filters.
+    """
+    products = (
+        Product.objects.select_related('category').only(*PRODUCT_CARD_FIELDS)
+    )
     query = None
     categories = None
     current_categories = None
     sort = None
     direction = None
+    sort_expression = None
+    descending = False
 
     if request.GET:
         # Sorting
         if 'sort' in request.GET:
             sort = request.GET['sort']
-            sortkey = sort
-
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-
-            if sortkey == 'category':
-                sortkey = 'category__name'
+            if sort in SORT_EXPRESSIONS:
+                sort_expression = SORT_EXPRESSIONS[sort]()
 
             if 'direction' in request.GET:
                 direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
+                descending = direction == 'desc'
 
-            products = products.order_by(sortkey)
-
-        # Search
+        # Search (ranked by relevance unless an explicit sort was chosen)
         if 'q' in request.GET:
             query = request.GET['q']
+            backend = get_search_backend()
+            products = backend.search(products, query)
 
-            if not query:
-                messages.error(request, "You didn't enter any search criteria!")
-                return redirect(reverse('products'))
-
-            queries = Q(name__icontains=query) | Q(description__icontains=query)
-            products = products.filter(queries)
+            if sort_expression is None:
+                sort_expression = F('search_rank')
+                descending = backend.rank_descending
 
         # Category filtering
         if 'category' in request.GET:
@@ -56,32 +108,180 @@ def all_products(request):
             if categories:
                 categories = categories.split(',')
                 products = products.filter(category__name__in=categories)
-                current_categories = Category.objects.filter(name__in=categories)
+                current_categories = get_categories_by_name(categories)
 
-    current_sorting = f'{sort}_{direction}'
+    paginator = KeysetPaginator(
+        products,
+        sort_expression=sort_expression,
+        descending=descending,
+        per_page=settings.PRODUCTS_PER_PAGE,
+    )
 
     context = {
-        'products': products,
         'search_term': query,
         'current_categories': current_categories,
-        'current_sorting': current_sorting,
+        'current_sorting': f'{sort}_{direction}',
     }
 
+    return paginator, context
+
+
+def _product_card_data(product):
+    """Serialise the fields a product card needs for the JSON listing."""
+    if product.image:
+        image_url = product.image.url
+    else:
+        image_url = static('images/noimage.png')
+
+    category = None
+    if product.category:
+        category = {
+            'name': product.category.name,
+            'friendly_name': product.category.get_friendly_name(),
+        }
+
+    return {
+        'id': product.id,
+        'name': product.name,
+        'url': reverse('product_detail', args=[product.id]),
+        'image_url': image_url,
+        'price_personal': str(product.price_personal),
+        'rating': str(product.rating) if product.rating is not None else None,
+        'category': category,
+    }
+
+
+def _listing_params(request):
+    """
+    Return the query parameters identifying a listing, minus the cursor.
+    Anything outside LISTING_PARAMS is ignored, so junk parameters can't
+    fill the cache with copies of the same page.
+    """
+    return [
+        (key, ','.join(request.GET.getlist(key)))
+        for key in LISTING_PARAMS
+        if key in request.GET
+    ]
+
+
+def _listing_page(request, paginator):
+    """
+    Return the requested page, served from the catalog cache when the
+    same page was built before.
+    """
+    cursor = request.GET.get('cursor')
+    params = _listing_params(request)
+    params.extend([('per_page', paginator.per_page), ('cursor', cursor or '')])
+
+    return get_listing(params, lambda: paginator.page(cursor))
+
+
+def _listing_total(request, paginator):
+    """
+    Return the number of products matching the listing's filters. The
+    count is cached without the cursor, so only the first page to miss
+    runs the COUNT.
+    """
+    return get_listing_total(
+        _listing_params(request), paginator.queryset.count
+    )
+
+
+@vary_on_cookie
+@condition(etag_func=products_etag, last_modified_func=products_last_modified)
+def all_products(request):
+    """A view to show all products, including sorting and search queries"""
+
+    if 'q' in request.GET and not request.GET['q']:
+        messages.error(request, "You didn't enter any search criteria!")
+        return redirect(reverse('products'))
+
+    paginator, context = _product_listing(request)
+    page = _listing_page(request, paginator)
+    product_total = _listing_total(request, paginator)
+
+    # Ownership is per visitor, so it is marked outside the cached cards.
+    owned = owned_products(request.user)
+    cards = render_product_cards(page.items)
+
+    context.update({
+        'products': page.items,
+        'product_cards': [
+            (card, product.pk in owned) for card, product in zip(cards, page.items)
+        ],
+        'product_total': product_total,
+        'page': page,
+    })
+
     return render(request, 'products/products.html', context)
 
 
+def products_page(request):
+    """
+    JSON variant of all_products for infinite scroll.
+
+    Accepts the same parameters plus ``cursor`` and returns one page of
+    cards with the cursor for the next page.
+    """
+
+    if 'q' in request.GET and not request.GET['q']:
+        return JsonResponse(
+            {'error': "You didn't enter any search criteria!"}, status=400
+        )
+
+    paginator, _ = _product_listing(request)
+    page = _listing_page(request, paginator)
+
+    owned = owned_products(request.user)
+
+    return JsonResponse({
+        'results': [
+            {**get_product_dict(p, _product_card_data), 'owned': p.pk in owned}
+            for p in page.items
+        ],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
+
+
+@vary_on_cookie
+@condition(etag_func=product_detail_etag)
 def product_detail(request, product_id):
     """A view to show individual product details"""
 
-    product = get_object_or_404(Product, pk=product_id)
+    product = get_product(product_id)
+    if product is None:
+        raise Http404('No Product matches the given query.')
+
+    owned_licenses = owned_products(request.user).get(product.pk, frozenset())
 
     context = {
         'product': product,
+        'owned_licenses': sorted(owned_licenses),
     }
 
     return render(request, 'products/product_detail.html', context)
 
 
+@login_required
+def download_product(request, product_id):
+    """Deliver a purchased product's file to its owner."""
+
+    product = get_product(product_id)
+    if product is None:
+        raise Http404('Product not found')
+
+    if not user_owns_product(request.user, product.pk):
+        messages.error(request, 'Please purchase this product to download it.')
+        return redirect(reverse('product_detail', args=[product.pk]))
+
+    response = download_response(request, product)
+    if response is None:
+        messages.error(request, 'This product has no file to download yet.')
+        return redirect(reverse('product_detail', args=[product.pk]))
+    return response
+
+
 def add_product(request):
     """Add a product to the store."""
 
@@ -1,3 +1,64 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from checkout.models import Order
+from checkout.utils import create_lineitems_from_bag
+from products.models import Product
+
+
+@override_settings(ORDERS_PER_PAGE=10)
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", password="pw")
+        self.client.force_login(self.user)
+        self.products = [
+            Product.objects.create(name=f"Kit {i}", sku=f"kit-{i}") for i in range(3)
+        ]
+
+    def _add_orders(self, count):
+        bag = {
+            str(p.id): {"items_by_license": {"personal": 1, "commercial": 2}}
+            for p in self.products
+        }
+        for i in range(count):
+            order = Order.objects.create(
+                user_profile=self.user.userprofile,
+                full_name="Buyer",
+                email="buyer@example.com",
+                phone_number="1",
+                country="GB",
+                town_or_city="London",
+                street_address1="1 High Street",
+            )
+            create_lineitems_from_bag(order, bag)
+
+    def _get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("profile"), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_history_is_paginated_with_item_counts(self):
+        self._add_orders(12)
+
+        response, _ = self._get()
+        page = response.context["orders"]
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page[0].item_count, 9)
+        self.assertContains(response, "9 items")
+        self.assertContains(response, "(Commercial)")
+
+        response, _ = self._get(page=2)
+        self.assertEqual(len(response.context["orders"]), 2)
+
+    def test_query_count_does_not_grow_with_history(self):
+        self._add_orders(2)
+        _, few = self._get()
+
+        self._add_orders(30)
+        _, many = self._get()
+
+        self.assertEqual(few, many)
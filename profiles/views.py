@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import render
 
-from checkout.models import Order
+from checkout.models import Order, OrderLineItem
 from .forms import UserProfileForm
 from .models import UserProfile
 
@@ -22,14 +26,29 @@ def profile(request):
     else:
         form = UserProfileForm(instance=profile)
 
-    orders = profile.orders.all().order_by("-date")
+    # One page of orders with their item counts, plus one query for all of
+    # the page's line items and products, however long the history is.
+    orders = (
+        profile.orders.order_by("-date", "-pk")
+        .annotate(item_count=Coalesce(Sum("lineitems__quantity"), 0))
+        .prefetch_related(
+            Prefetch(
+                "lineitems",
+                queryset=OrderLineItem.objects.select_related("product").only(
+                    "order_id", "license_type", "quantity", "product__name"
+                ),
+            )
+        )
+    )
+    page = Paginator(orders, settings.ORDERS_PER_PAGE).get_page(request.GET.get("page"))
 
     context = {
         "form": form,
-        "orders": orders,
+        "orders": page,
+        "page": page,
         "profile": profile,
     }
-    return render(request, "profiles/profile.html", context)
+    return render(request, "profiles/profiles.html", context)
 
 
 @login_required
@@ -0,0 +1,17 @@
+from django.contrib import admin
+
+from .models import DailySalesRollup
+
+
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ("date", "product", "license_type", "revenue", "units", "order_count")
+    list_filter = ("license_type",)
+    list_select_related = ("product",)
+    date_hierarchy = "date"
+    readonly_fields = ("date", "product", "license_type", "revenue", "units", "order_count")
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(DailySalesRollup, DailySalesRollupAdmin)
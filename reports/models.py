@@ -0,0 +1,33 @@
+from decimal import Decimal
+
+from django.db import models
+
+from products.models import Product
+
+
+class DailySalesRollup(models.Model):
+    """
+    Revenue, units and orders for one product and license type on one day
+    (in TIME_ZONE). Kept up to date as orders are finalized; rebuild with
+    the rebuild_sales_rollups command after editing or deleting orders.
+    """
+
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    license_type = models.CharField(max_length=20)
+
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    units = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "product", "license_type"],
+                name="reports_rollup_unique_day_product_license",
+            ),
+        ]
+        ordering = ("-date", "product", "license_type")
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} ({self.license_type})"
@@ -0,0 +1,141 @@
+"""
+Daily sales rollups.
+
+record_order() adds a new (paid) order to its day's DailySalesRollup rows
+with UPDATE ... SET revenue = revenue + %s, so concurrent orders add to
+the same row instead of overwriting each other. rebuild() recomputes a
+date range from the line items. Reports read only the rollup table.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from checkout.models import OrderLineItem
+
+from .models import DailySalesRollup
+
+
+def _license(license_type):
+    return (license_type or "personal").lower()
+
+
+def _increment(day, product_id, license_type, revenue, units):
+    rows = DailySalesRollup.objects.filter(
+        date=day, product_id=product_id, license_type=license_type
+    )
+    changes = {
+        "revenue": F("revenue") + revenue,
+        "units": F("units") + units,
+        "order_count": F("order_count") + 1,
+    }
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(
+                date=day,
+                product_id=product_id,
+                license_type=license_type,
+                revenue=revenue,
+                units=units,
+                order_count=1,
+            )
+    except IntegrityError:
+        # Another order created the row first.
+        rows.update(**changes)
+
+
+def record_order(order, lineitems):
+    """Add ``order`` (with its ``lineitems``) to the daily rollups."""
+    totals = defaultdict(lambda: [Decimal("0.00"), 0])
+    for lineitem in lineitems:
+        key = (lineitem.product_id, _license(lineitem.license_type))
+        totals[key][0] += lineitem.lineitem_total
+        totals[key][1] += lineitem.quantity
+
+    day = timezone.localdate(order.date)
+    with transaction.atomic():
+        # A fixed row order keeps concurrent orders from deadlocking.
+        for (product_id, license_type), (revenue, units) in sorted(totals.items()):
+            _increment(day, product_id, license_type, revenue, units)
+
+
+def rebuild(start=None, end=None, batch_size=1000):
+    """
+    Recompute the rollups for orders placed on or after ``start`` and
+    before ``end`` (dates; None for no limit). Returns the number of rows.
+    """
+    lineitems = OrderLineItem.objects.all()
+    rollups = DailySalesRollup.objects.all()
+    if start:
+        lineitems = lineitems.filter(order__date__date__gte=start)
+        rollups = rollups.filter(date__gte=start)
+    if end:
+        lineitems = lineitems.filter(order__date__date__lt=end)
+        rollups = rollups.filter(date__lt=end)
+
+    rows = (
+        lineitems.annotate(
+            day=TruncDate("order__date"),
+            license=Coalesce("license_type", Value("personal")),
+        )
+        .values("day", "product_id", "license")
+        .annotate(
+            revenue_sum=Sum("lineitem_total"),
+            units_sum=Sum("quantity"),
+            orders=Count("order", distinct=True),
+        )
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(
+                DailySalesRollup(
+                    date=row["day"],
+                    product_id=row["product_id"],
+                    license_type=_license(row["license"]),
+                    revenue=row["revenue_sum"],
+                    units=row["units_sum"],
+                    order_count=row["orders"],
+                )
+            )
+            if len(batch) >= batch_size:
+                created += len(DailySalesRollup.objects.bulk_create(batch))
+                batch = []
+        created += len(DailySalesRollup.objects.bulk_create(batch))
+    return created
+
+
+def revenue_by_license(start, end):
+    """Revenue and units per day and license type, oldest day first."""
+    return (
+        DailySalesRollup.objects.filter(date__gte=start, date__lt=end)
+        .values("date", "license_type")
+        .annotate(revenue_sum=Sum("revenue"), units_sum=Sum("units"))
+        .order_by("date", "license_type")
+    )
+
+
+def top_products(start, end, limit=10):
+    """
+    The best-selling products by revenue. ``orders`` counts an order once
+    per day and license type it bought the product with.
+    """
+    return (
+        DailySalesRollup.objects.filter(date__gte=start, date__lt=end)
+        .values("product_id", "product__name", "product__sku")
+        .annotate(
+            revenue_sum=Sum("revenue"),
+            units_sum=Sum("units"),
+            orders=Sum("order_count"),
+        )
+        .order_by("-revenue_sum", "product_id")[:limit]
+    )
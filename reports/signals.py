@@ -0,0 +1,15 @@
+from django.dispatch import receiver
+
+from checkout.signals import order_finalized
+
+from .rollups import record_order
+
+
+@receiver(order_finalized)
+def add_order_to_rollups(sender, order, lineitems, **kwargs):
+    """
+    Add a new order to the daily sales rollups, in its transaction.
+    Orders are only created once Stripe reports the payment as succeeded,
+    so an abandoned or declined checkout never counts as revenue.
+    """
+    record_order(order, lineitems)
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from checkout.models import Order
+from checkout.stripe_client import get_stripe_client, reset_stripe_client
+from checkout.utils import get_or_create_order
+from products.models import Product
+
+from .models import DailySalesRollup
+from .rollups import rebuild
+
+ORDER_DEFAULTS = {
+    "full_name": "Test Buyer",
+    "email": "buyer@example.com",
+    "phone_number": "0123456789",
+    "country": "GB",
+    "town_or_city": "London",
+    "street_address1": "1 High Street",
+}
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.kit = Product.objects.create(
+            name="Kit",
+            sku="kit",
+            price_personal=Decimal("10.00"),
+            price_commercial=Decimal("25.00"),
+        )
+        self.icons = Product.objects.create(name="Icons", sku="icons", price_personal=Decimal("4.00"))
+
+    def _order(self, pid, bag):
+        order, _ = get_or_create_order(pid, ORDER_DEFAULTS, bag)
+        return order
+
+    def _rollups(self):
+        return {
+            (row.product_id, row.license_type): (row.revenue, row.units, row.order_count)
+            for row in DailySalesRollup.objects.all()
+        }
+
+    def test_finalized_orders_are_added_to_the_day(self):
+        bag = {str(self.kit.id): {"items_by_license": {"personal": 2, "commercial": 1}}}
+        self._order("pi_1", bag)
+        self._order("pi_2", {**bag, str(self.icons.id): {"items_by_license": {"personal": 1}}})
+        # A redelivered PaymentIntent doesn't count twice.
+        self._order("pi_2", bag)
+
+        self.assertEqual(
+            self._rollups(),
+            {
+                (self.kit.id, "personal"): (Decimal("40.00"), 4, 2),
+                (self.kit.id, "commercial"): (Decimal("50.00"), 2, 2),
+                (self.icons.id, "personal"): (Decimal("4.00"), 1, 1),
+            },
+        )
+        self.assertEqual(
+            set(DailySalesRollup.objects.values_list("date", flat=True)),
+            {timezone.localdate()},
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self._order("pi_1", {str(self.kit.id): {"items_by_license": {"personal": 1}}})
+        self._order(
+            "pi_2",
+            {
+                str(self.kit.id): {"items_by_license": {"personal": 1, "commercial": 3}},
+                str(self.icons.id): {"items_by_license": {"personal": 2}},
+            },
+        )
+        incremental = self._rollups()
+
+        Order.objects.get(stripe_pid="pi_1").delete()
+        out = StringIO()
+        call_command("rebuild_sales_rollups", stdout=out)
+
+        self.assertIn("Rebuilt 3 rollup rows", out.getvalue())
+        expected = dict(incremental)
+        expected[(self.kit.id, "personal")] = (Decimal("10.00"), 1, 1)
+        self.assertEqual(self._rollups(), expected)
+
+    def test_rebuild_only_touches_the_requested_days(self):
+        self._order("pi_1", {str(self.kit.id): {"items_by_license": {"personal": 1}}})
+        yesterday = timezone.localdate() - timedelta(days=1)
+        old = DailySalesRollup.objects.create(
+            date=yesterday, product=self.icons, license_type="personal", revenue=1, units=1, order_count=1
+        )
+
+        rebuild(start=timezone.localdate())
+
+        self.assertTrue(DailySalesRollup.objects.filter(pk=old.pk).exists())
+        self.assertEqual(DailySalesRollup.objects.count(), 2)
+
+    @override_settings(STRIPE_CLIENT_BACKEND="fake")
+    def test_only_paid_checkouts_are_counted(self):
+        reset_stripe_client()
+        session = self.client.session
+        session["bag"] = {str(self.kit.id): {"items_by_license": {"personal": 1}}}
+        session.save()
+        client_secret = self.client.get(reverse("checkout")).context["client_secret"]
+        form = {**ORDER_DEFAULTS, "client_secret": client_secret}
+
+        self.client.post(reverse("checkout"), form)
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+        [intent] = get_stripe_client().backend.intents.values()
+        intent.status = "succeeded"
+        self.client.post(reverse("checkout"), form)
+        self.assertEqual(self._rollups(), {(self.kit.id, "personal"): (Decimal("10.00"), 1, 1)})
+
+
+class SalesReportViewTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="Dashboard kit", sku="kit", price_personal=Decimal("10.00")
+        )
+        bag = {str(self.product.id): {"items_by_license": {"personal": 3}}}
+        get_or_create_order("pi_1", ORDER_DEFAULTS, bag)
+
+    def test_staff_only(self):
+        self.client.force_login(User.objects.create_user("buyer"))
+        response = self.client.get(reverse("sales_report"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_report_reads_only_rollups(self):
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("sales_report"), {"days": 30})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["revenue_total"], Decimal("30.00"))
+        self.assertEqual(response.context["units_total"], 3)
+        self.assertContains(response, "Dashboard kit")
+        self.assertContains(response, "£30.00")
+        self.assertFalse(any("checkout_orderlineitem" in q["sql"] for q in queries))
@@ -0,0 +1,59 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+from django.utils import timezone
+
+from checkout.models import OrderLineItem
+
+from .rollups import revenue_by_license, top_products
+
+PERIODS = (7, 30, 90, 365)
+
+
+@staff_member_required
+def sales_report(request):
+    """Revenue by license type per day and the top products for a period."""
+    try:
+        days = int(request.GET.get("days", PERIODS[0]))
+    except ValueError:
+        days = PERIODS[0]
+    if days not in PERIODS:
+        days = PERIODS[0]
+
+    end = timezone.localdate() + timedelta(days=1)
+    start = end - timedelta(days=days)
+
+    licenses = [value for value, _ in OrderLineItem.LICENSE_CHOICES]
+    by_day = defaultdict(lambda: dict.fromkeys(licenses, Decimal("0.00")))
+    totals = dict.fromkeys(licenses, Decimal("0.00"))
+    units = 0
+    for row in revenue_by_license(start, end):
+        by_day[row["date"]][row["license_type"]] = row["revenue_sum"]
+        totals[row["license_type"]] = totals.get(row["license_type"], Decimal("0.00")) + row["revenue_sum"]
+        units += row["units_sum"]
+
+    days_rows = [
+        {
+            "date": day,
+            "revenue": [revenue.get(license_type, Decimal("0.00")) for license_type in licenses],
+            "total": sum(revenue.values(), Decimal("0.00")),
+        }
+        for day, revenue in sorted(by_day.items(), reverse=True)
+    ]
+
+    context = {
+        "days": days,
+        "periods": PERIODS,
+        "start": start,
+        "end": end - timedelta(days=1),
+        "license_labels": [label for _, label in OrderLineItem.LICENSE_CHOICES],
+        "days_rows": days_rows,
+        "license_totals": [totals[license_type] for license_type in licenses],
+        "revenue_total": sum(totals.values(), Decimal("0.00")),
+        "units_total": units,
+        "top_products": top_products(start, end),
+    }
+    return render(request, "reports/sales_report.html", context)